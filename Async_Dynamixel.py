@@ -0,0 +1,315 @@
+'''
+Async_Dynamixel.py
+Date:		17.10.26
+
+asyncio version of the AX18A class. AsyncBus registers the non-blocking
+file descriptor of a transport with the event loop, so waiting for a
+status packet never blocks other tasks (TCP clients, telemetry, motion).
+Packets are built and checked with the same methods as the AX18A class.
+
+Example:
+	bus = AsyncBus(Transport.get_transport('pty'))
+	servo = await AsyncAX18A.create(bus, 3)
+	await servo.move(180, AX18A.slow)
+	block = await bus.read_block(3, 0x24, 8)
+'''
+
+import os
+import asyncio
+from Dynamixel import AX18A
+
+class AsyncBus:
+	# Owner of the servo bus for asyncio tasks. Transactions are run one at
+	# a time, since the bus is half duplex
+	#	transport:	Transport with a file descriptor (serial or pty)
+	#	timeout:	status packet timeout in seconds
+
+	def __init__(self, transport, timeout=AX18A.default_timeout):
+		self.transport = transport
+		self.timeout = timeout
+		self.fd = transport.fileno()
+		os.set_blocking(self.fd, False)
+
+		self.rx_buffer = bytearray()
+		self.waiter = None 			# (ID, future) of transaction waiting for status packet
+		self.registered = set() 	# Servos with reg_write values waiting for action
+		self.lock = None 			# asyncio.Lock, created in the running loop
+		self.loop = None
+
+	def open(self):
+		# Method to register the file descriptor with the running event loop
+		if (self.loop == None):
+			self.loop = asyncio.get_running_loop()
+			self.lock = asyncio.Lock()
+			self.loop.add_reader(self.fd, self.on_readable)
+
+	def close(self):
+		# Method to remove the file descriptor from the event loop
+		if (self.loop != None):
+			self.loop.remove_reader(self.fd)
+			self.loop = None
+
+	def on_readable(self):
+		# Called by the event loop when bytes have arrived
+		try:
+			data = os.read(self.fd, 256)
+		except BlockingIOError:
+			return
+		self.rx_buffer += data
+		self.parse()
+
+	def parse(self):
+		# Method to take complete status packets from the receive buffer and
+		# hand them to the waiting transaction. Noise before the start signal
+		# and packets nobody waits for are dropped
+
+		buf = self.rx_buffer
+		while (len(buf) >= 6):
+			idx = buf.find(b"\xFF\xFF")
+			while (idx >= 0 and idx+2 < len(buf) and buf[idx+2] == 0xFF):
+				idx += 1
+			if (idx < 0):
+				# Keep a trailing 0xFF as it might be the first start byte
+				del buf[:len(buf)-1]
+				return
+			del buf[:idx]
+			if (len(buf) < 4):
+				return
+			packet_length = buf[3]+4
+			if (len(buf) < packet_length):
+				return
+
+			status_packet = bytes(buf[:packet_length])
+			del buf[:packet_length]
+
+			if (self.waiter == None):
+				continue
+			(ID, future) = self.waiter
+			if (future.done()):
+				continue
+			try:
+				AX18A.check_status_checksum(status_packet)
+				if (status_packet[2] != ID):
+					continue
+				AX18A.check_status_error(status_packet)
+			except (AX18A.CommError, AX18A.ServoError) as err:
+				future.set_exception(err)
+			else:
+				future.set_result(status_packet)
+
+	async def send(self, packet):
+		# Method to write an instruction packet without blocking
+		self.transport.set_direction(AX18A.GPIO_direction_TX)
+		view = memoryview(packet)
+		while (len(view) > 0):
+			try:
+				written = os.write(self.fd, view)
+			except BlockingIOError:
+				written = 0
+			view = view[written:]
+			if (len(view) > 0):
+				await asyncio.sleep(0)
+		self.transport.set_direction(AX18A.GPIO_direction_RX)
+
+	async def transaction(self, ID, instruction, parameters=(), status=True, nParams=0):
+		# Method to send an instruction and wait for the status packet
+		#	ID:				servo ID
+		#	instruction:	String matching a key from the AX18A.instruction dictionary
+		#	parameters:		instruction parameters
+		#	status:			False if no status packet is returned
+		#	nParams:		number of parameters expected in the status packet
+		# Failed attempts are retried as decided by AX18A.retry_policy, like AX18A
+		# Returns status packet (bytes), or 0 if no status packet
+
+		self.open()
+		policy = AX18A.retry_policy
+		packet = AX18A.build_instruction_packet(ID, instruction, parameters)
+		async with self.lock:
+			if (status):
+				max_attempts = policy.get_attempts(ID)
+				if (max_attempts == 0):
+					raise AX18A.CircuitOpenError(ID, "transaction: servo not responding, circuit open")
+			else:
+				max_attempts = policy.attempts
+
+			attempts = 0
+			while (True):
+				try:
+					if (not status):
+						await self.send(packet)
+						return 0
+
+					future = self.loop.create_future()
+					self.waiter = (ID, future)
+					try:
+						await self.send(packet)
+						status_packet = await asyncio.wait_for(future, self.timeout)
+					except asyncio.TimeoutError:
+						raise AX18A.TimeoutError(ID, "get_status_packet: Timeout error")
+					finally:
+						self.waiter = None
+					if (len(status_packet) != nParams+6):
+						raise AX18A.CommError(ID, "get_status_packet: Wrong number of parameters")
+					policy.record_success(ID)
+					return status_packet
+				except (AX18A.CommError, AX18A.ServoError) as err:
+					attempts += 1
+					if (attempts >= max_attempts or not policy.should_retry(err, attempts)):
+						if (status):
+							policy.record_failure(ID, err)
+						err.args = (ID,) + err.args[1:]
+						raise err
+					# Drop any partial or late reply before next attempt
+					self.rx_buffer.clear()
+					await asyncio.sleep(policy.get_delay(attempts))
+
+	async def ping(self, ID):
+		return await self.transaction(ID, 'ping')
+
+	async def read_block(self, ID, address, length):
+		# Method to read a contiguous block of registers of servo ID
+		# Returns the values read (bytes)
+		if (address < 0 or length < 1 or address+length > 50):
+			raise AX18A.ParameterError(ID, "read_block: block must be within register addresses 0-49")
+		status_packet = await self.transaction(ID, 'read_data', (address, length), nParams=length)
+		return AX18A.get_parameters_from_status_packet(status_packet)
+
+	async def write_data(self, ID, address, *parameters, status=True):
+		return await self.transaction(ID, 'write_data', (address,) + tuple(parameters), status)
+
+	async def reg_write(self, ID, address, *parameters, status=True):
+		return await self.transaction(ID, 'reg_write', (address,) + tuple(parameters), status)
+
+	async def action(self):
+		# Broadcast action, no status packet
+		# The values of earlier reg_write calls are stored in the local
+		# registers once action is sent, like AX18A.action
+		status_packet = await self.transaction(AX18A.broadcasting_id, 'action', (), False)
+		for servo in self.registered:
+			servo.apply_registered_write()
+		self.registered.clear()
+		return status_packet
+
+	async def sync_write(self, servos, address, *args):
+		# Method to write to several servos with one packet, see AX18A.sync_write
+		#	servos:	AsyncAX18A objects
+		nParams = AX18A.check_sync_write(servos, address, args)
+		parameters = [address, nParams]
+		for servo, values in zip(servos, args):
+			parameters.append(servo.id)
+			parameters.extend(values)
+		await self.transaction(AX18A.broadcasting_id, 'sync_write', parameters, False)
+		for servo, values in zip(servos, args):
+			servo.register[address:(address+nParams)] = values
+
+class AsyncAX18A:
+	# asyncio counterpart of AX18A for a single servo. Use create to get a
+	# servo with the status return level already read
+	#	bus:	AsyncBus the servo is on
+	#	ID:		servo ID
+
+	__slots__ = ('bus', 'id', 'register', 'level_known', 'registered_write')
+
+	def __init__(self, bus, ID):
+		self.bus = bus
+		self.id = ID
+		self.register = bytearray(AX18A.default_register)
+		self.register[AX18A.address['id']] = ID
+		self.level_known = False 	# Set when the status return level has been read
+		self.registered_write = None 	# (address, values) of reg_write waiting for action
+
+	@classmethod
+	async def create(cls, bus, ID):
+		# Method to make a servo object and read its status return level
+		servo = cls(bus, ID)
+		await servo.read_status_level()
+		return servo
+
+	async def read_status_level(self):
+		# Method to read the status return level into the local register.
+		# A servo answering pings but not read data has level 0
+		level_address = AX18A.level_address
+		try:
+			await self.read_block(level_address, 1)
+		except AX18A.TimeoutError:
+			await self.ping()
+			self.register[level_address] = 0
+		self.level_known = True
+
+	def get_status_expected(self, instruction, address=None, parameters=()):
+		# Status packets follow the status return level in the local
+		# register, see AX18A.get_status_expected
+		if (self.id == AX18A.broadcasting_id):
+			return False
+		level_address = AX18A.level_address
+		if (address != None and address <= level_address < address+len(parameters)):
+			level = parameters[level_address-address]
+		else:
+			level = self.register[level_address]
+		return instruction == 'ping' or level >= 2 or (level == 1 and instruction == 'read_data')
+
+	async def ping(self):
+		return await self.bus.ping(self.id)
+
+	async def read_data(self, address, length):
+		# Returns value if length is 1, otherwise bytes, like AX18A.read_data
+		block = await self.read_block(address, length)
+		if (length == 1):
+			return block[0]
+		return block
+
+	async def read_block(self, address, length):
+		block = await self.bus.read_block(self.id, address, length)
+		self.register[address:(address+length)] = block
+		return block
+
+	async def write_data(self, address, *parameters):
+		if (not self.level_known):
+			await self.read_status_level()
+		status = self.get_status_expected('write_data', address, parameters)
+		status_packet = await self.bus.write_data(self.id, address, *parameters, status=status)
+		self.register[address:(address+len(parameters))] = parameters
+		return status_packet
+
+	async def reg_write(self, address, *parameters):
+		if (not self.level_known):
+			await self.read_status_level()
+		status = self.get_status_expected('reg_write', address, parameters)
+		status_packet = await self.bus.reg_write(self.id, address, *parameters, status=status)
+		# Values take effect on action, so they are kept until then
+		self.registered_write = (address, tuple(parameters))
+		self.bus.registered.add(self)
+		return status_packet
+
+	def apply_registered_write(self):
+		# Method to store the values of the last reg_write in the local register
+		if (self.registered_write != None):
+			(address, values) = self.registered_write
+			self.registered_write = None
+			self.register[address:(address+len(values))] = values
+
+	async def move(self, angle, speed=AX18A.medium, method="normal"):
+		# See AX18A.move
+		move_parameters = AX18A.encode_move(self.id, angle, speed)
+		if (method == "reg"):
+			return await self.reg_write(AX18A.address['goal_position_l'], *move_parameters)
+		return await self.write_data(AX18A.address['goal_position_l'], *move_parameters)
+
+	async def get_state(self):
+		# See AX18A.get_state
+		block = await self.read_block(AX18A.state_address, AX18A.state_length)
+		return AX18A.decode_state(block)
+
+	async def get_position(self, time="current"):
+		# See AX18A.get_position
+		if (time == "current"):
+			address = AX18A.address['present_position_l']
+		elif (time == "goal"):
+			address = AX18A.address['goal_position_l']
+		else:
+			raise AX18A.ParameterError(self.id, "get_position: time must be either current or goal")
+		(position_l, position_h) = await self.read_block(address, 2)
+		return AX18A.value_to_angle(position_h << 8 | position_l)
+
+	async def set_torque_enable(self, torque_enable):
+		return await self.write_data(AX18A.address['torque_enable'], 1 if torque_enable else 0)
@@ -0,0 +1,195 @@
+'''
+Batch_Codec.py
+Date:		17.10.26
+
+Vectorised encoding of move packets and decoding of status packets with
+NumPy, for streaming precomputed trajectories. Conversions and range
+checks are the same as in AX18A.move and AX18A.decode_state.
+
+Example:
+	# One sync write packet per trajectory point, servos 3 and 4
+	packets = encode_sync_moves((3, 4), angles, AX18A.slow)
+	for i in range(len(angles)):
+		AX18A.port.write(packets[i])
+'''
+
+from Dynamixel import AX18A
+
+# NumPy is only needed for the batch codec
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+move_length = 11 	# Bytes in a goal position and moving speed write packet
+
+def check_numpy():
+	if (np is None):
+		raise RuntimeError("Batch_Codec: numpy is required")
+
+def get_move_values(ids, angles, speeds):
+	# Function to convert angles and speeds to register values, see
+	# AX18A.encode_move
+	#	ids:	servo IDs, used in error messages
+	# Returns uint8 array with (angle_l, angle_h, speed_l, speed_h) in the
+	# last axis
+
+	angles = np.asarray(angles, dtype=np.float64)
+	speeds = np.broadcast_to(np.asarray(speeds, dtype=np.float64), angles.shape)
+	ids = np.broadcast_to(np.asarray(ids), angles.shape)
+
+	# Check angles and speeds
+	bad = (angles < 30) | (angles > 330) | ~np.isfinite(angles)
+	if (bad.any()):
+		raise AX18A.ParameterError(int(ids[bad][0]), "move: angle must be between 30 and 330")
+	bad = (speeds < 0) | (speeds > 113.5) | ~np.isfinite(speeds)
+	if (bad.any()):
+		raise AX18A.ParameterError(int(ids[bad][0]), "move: speed number must be between 0 and 113.5")
+
+	angle_values = ((angles-30)*3.41).astype(np.int64)
+	speed_values = (speeds/0.111).astype(np.int64)
+
+	values = np.empty(angles.shape + (4,), dtype=np.uint8)
+	values[..., 0] = angle_values & 0xFF
+	values[..., 1] = angle_values >> 8
+	values[..., 2] = speed_values & 0xFF
+	values[..., 3] = speed_values >> 8
+	return values
+
+def encode_moves(ids, angles, speeds=AX18A.medium, instruction='write_data'):
+	# Function to encode one move packet for each (ID, angle, speed)
+	#	ids:			servo IDs
+	#	angles:			angles in degrees (30-330)
+	#	speeds:			speeds in rpm (0-113.5), one for all or one for each
+	#	instruction:	write_data or reg_write
+	# Returns uint8 array of shape (n, 11), use .tobytes() to get one
+	# contiguous buffer of all packets
+
+	check_numpy()
+	if (not instruction in ('write_data', 'reg_write')):
+		raise AX18A.ParameterError(AX18A.broadcasting_id, "encode_moves: instruction must be write_data or reg_write")
+
+	ids = np.asarray(ids).ravel()
+	angles = np.broadcast_to(np.asarray(angles, dtype=np.float64).ravel(), ids.shape)
+	if (((ids < 0) | (ids > AX18A.broadcasting_id)).any()):
+		raise AX18A.ParameterError(AX18A.broadcasting_id, "encode_moves: IDs must be between 0 and 254")
+
+	packets = np.empty((len(ids), move_length), dtype=np.uint8)
+	packets[:, 0] = 0xFF
+	packets[:, 1] = 0xFF
+	packets[:, 2] = ids
+	packets[:, 3] = move_length-4
+	packets[:, 4] = AX18A.instruction[instruction]
+	packets[:, 5] = AX18A.address['goal_position_l']
+	packets[:, 6:10] = get_move_values(ids, angles, speeds)
+	packets[:, 10] = ~packets[:, 2:10].sum(axis=1, dtype=np.uint32) & 0xFF
+	return packets
+
+def encode_sync_moves(ids, angles, speeds=AX18A.medium):
+	# Function to encode a sync write packet moving all servos for each
+	# point of a trajectory
+	#	ids:	servo IDs, one for each column of angles
+	#	angles:	array of shape (points, servos) in degrees (30-330)
+	#	speeds:	speeds in rpm (0-113.5), broadcast to the shape of angles
+	# Returns uint8 array of shape (points, packet length)
+
+	check_numpy()
+	ids = np.asarray(ids).ravel()
+	angles = np.atleast_2d(np.asarray(angles, dtype=np.float64))
+	(nPoints, nServos) = angles.shape
+	if (nServos != len(ids)):
+		raise AX18A.ParameterError(AX18A.broadcasting_id, "sync_write: number of servos not equal to number of write tuples")
+	if (len(set(ids.tolist())) != nServos or ((ids < 0) | (ids >= AX18A.broadcasting_id)).any()):
+		raise AX18A.ParameterError(AX18A.broadcasting_id, "sync_write: servo IDs must be unique and not broadcasting ID")
+	length = 5*nServos + 4
+	if (length > 0xFF):
+		raise AX18A.ParameterError(AX18A.broadcasting_id, "sync_write: too much data for one instruction packet")
+
+	packets = np.empty((nPoints, length+4), dtype=np.uint8)
+	packets[:, 0] = 0xFF
+	packets[:, 1] = 0xFF
+	packets[:, 2] = AX18A.broadcasting_id
+	packets[:, 3] = length
+	packets[:, 4] = AX18A.instruction['sync_write']
+	packets[:, 5] = AX18A.address['goal_position_l']
+	packets[:, 6] = 4
+	servo_data = packets[:, 7:-1].reshape(nPoints, nServos, 5)
+	servo_data[:, :, 0] = ids
+	servo_data[:, :, 1:] = get_move_values(np.broadcast_to(ids, angles.shape), angles, speeds)
+	packets[:, -1] = ~packets[:, 2:-1].sum(axis=1, dtype=np.uint32) & 0xFF
+	return packets
+
+def decode_status_stream(data, nParams):
+	# Function to find and check all status packets with nParams parameters
+	# in a stream of received bytes (e.g. replies to a read_data sequence).
+	# Noise, packets of other lengths and packets with checksum errors are
+	# skipped
+	#	data:		received bytes
+	#	nParams:	number of parameters in each status packet
+	# Returns dictionary of arrays:
+	#	offsets:	index of each packet in data
+	#	ids:		servo ID of each packet
+	#	errors:		error byte of each packet
+	#	parameters:	uint8 array of shape (packets, nParams)
+
+	check_numpy()
+	data = np.frombuffer(data, dtype=np.uint8)
+	packet_length = nParams+6
+	empty = {
+		'offsets': np.empty(0, dtype=np.int64),
+		'ids': np.empty(0, dtype=np.uint8),
+		'errors': np.empty(0, dtype=np.uint8),
+		'parameters': np.empty((0, nParams), dtype=np.uint8)
+	}
+	if (len(data) < packet_length):
+		return empty
+
+	# Candidates: start signal, ID not 0xFF and matching length byte
+	n = len(data) - packet_length + 1
+	starts = np.flatnonzero((data[:n] == 0xFF) & (data[1:n+1] == 0xFF) & (data[2:n+2] != 0xFF) & (data[3:n+3] == nParams+2))
+	if (len(starts) == 0):
+		return empty
+
+	packets = data[starts[:, None] + np.arange(packet_length)]
+	checksums = ~packets[:, 2:-1].sum(axis=1, dtype=np.uint32) & 0xFF
+	valid = checksums == packets[:, -1]
+	starts = starts[valid]
+	packets = packets[valid]
+
+	# Drop candidates starting inside an accepted packet
+	keep = np.ones(len(starts), dtype=bool)
+	end = -1
+	for i, start in enumerate(starts.tolist()):
+		if (start < end):
+			keep[i] = False
+		else:
+			end = start + packet_length
+	packets = packets[keep]
+
+	return {
+		'offsets': starts[keep],
+		'ids': packets[:, 2],
+		'errors': packets[:, 4],
+		'parameters': packets[:, 5:-1]
+	}
+
+def decode_states(parameters):
+	# Function to convert present state blocks (8 registers from 0x24) to
+	# physical values, see AX18A.decode_state
+	#	parameters:	uint8 array of shape (n, 8)
+	# Returns dictionary of float arrays: position (degrees), speed (rpm),
+	# load (percent), voltage (V) and temperature (degrees Celsius)
+
+	check_numpy()
+	block = np.asarray(parameters, dtype=np.int64)
+	position_values = block[:, 1] << 8 | block[:, 0]
+	speed_values = block[:, 3] << 8 | block[:, 2]
+	load_values = block[:, 5] << 8 | block[:, 4]
+
+	return {
+		'position': position_values/3.41 + 30,
+		'speed': speed_values*0.111,
+		'load': (load_values & 0x3FF)/10.23 * (-1 + 2*(load_values >> 10)),
+		'voltage': block[:, 6]/10,
+		'temperature': block[:, 7].astype(np.float64)
+	}
@@ -0,0 +1,164 @@
+'''
+Board_Table.py
+Date:		17.10.26
+
+Precomputed poses for every square of the board used by the LabVIEW
+interface (DrawBoard, MovePiece and Move). For each square and height the
+table holds the joint angles and the goal position register value of each
+servo, so moving to a square needs no kinematics or conversions. The table
+is built once when the board is calibrated (Arm.build_board_table) and
+saved to a binary file, which is read into memory in one go at startup.
+
+File format, little endian:
+	magic		8 bytes, TABLE_MAGIC
+	columns		1 byte
+	rows		1 byte
+	heights		1 byte, number of heights in height_names
+	servos		1 byte, number of servos
+	servo IDs	1 byte each
+	records		one for each (row, column, height), in that order:
+		angles		4 floats, rot, elbow, hand and hand_rot in degrees
+		goals		2 bytes for each servo, goal position register value
+A square out of reach has NaN angles and all goals set to 0xFFFF.
+
+Squares are (column, row) tuples counted from 0, or names like "a1"
+(column letter, row number from 1).
+
+Example:
+	table = Board_Table.load("board.bin")
+	goals = table.get_goals("e2", 'approach')
+'''
+
+import os
+import math
+import struct
+
+TABLE_MAGIC = b"AXBRD\x00\x01\n"
+table_header = struct.Struct("<BBBB")
+angles_struct = struct.Struct("<4f")
+unreachable_goal = 0xFFFF
+
+# Board position relative to the arm (mm), see Kinematics for coordinates
+board = {
+	'columns': 8,
+	'rows': 8,
+	'square': 40.0, 			# Width of a square
+	'origin': (120.0, -140.0), 	# (x, y) of the centre of square (0, 0)
+	'height': {
+		'pickup': 20.0, 		# Grip point height holding a piece
+		'approach': 80.0 		# Height to move between squares
+	}
+}
+height_names = ('pickup', 'approach')
+
+def parse_square(square):
+	# Function to convert a square name like "a1" to a (column, row) tuple
+	# Tuples are returned unchanged
+	if (isinstance(square, str)):
+		if (len(square) < 2 or not square[1:].isdigit()):
+			raise ValueError("parse_square: invalid square name " + square)
+		return (ord(square[0].lower()) - ord('a'), int(square[1:]) - 1)
+	return tuple(square)
+
+def get_square_position(square, height, board=board):
+	# Function to get the (x, y, z) of the grip point at a square and height
+	(column, row) = parse_square(square)
+	(x, y) = board['origin']
+	return (x + row*board['square'], y + column*board['square'], board['height'][height])
+
+class BoardTable:
+	# Board table held in memory as the bytes of a table file
+	#	data:	bytes of a table file
+
+	def __init__(self, data):
+		data = memoryview(bytes(data))
+		if (bytes(data[0:len(TABLE_MAGIC)]) != TABLE_MAGIC):
+			raise ValueError("BoardTable: not a board table")
+		(self.columns, self.rows, nHeights, nServos) = table_header.unpack_from(data, len(TABLE_MAGIC))
+		if (nHeights != len(height_names)):
+			raise ValueError("BoardTable: table heights do not match height_names")
+
+		start = len(TABLE_MAGIC) + table_header.size
+		self.servo_ids = tuple(data[start:start+nServos])
+		self.goals_struct = struct.Struct("<%dH" % nServos)
+		self.record_length = angles_struct.size + self.goals_struct.size
+		self.records_start = start + nServos
+		if (len(data) != self.records_start + self.columns*self.rows*nHeights*self.record_length):
+			raise ValueError("BoardTable: table file is incomplete")
+		self.data = data
+
+	def get_offset(self, square, height):
+		# Method to get the position of a record in data
+		(column, row) = parse_square(square)
+		if (column < 0 or column >= self.columns or row < 0 or row >= self.rows):
+			raise ValueError("BoardTable: square not on board")
+		index = (row*self.columns + column)*len(height_names) + height_names.index(height)
+		return self.records_start + index*self.record_length
+
+	def get_angles(self, square, height='approach'):
+		# Method to get the joint angles at a square
+		# Returns dictionary with joint strings as keys, or None if the
+		# square is out of reach
+		angles = angles_struct.unpack_from(self.data, self.get_offset(square, height))
+		if (math.isnan(angles[0])):
+			return None
+		return dict(zip(('rot', 'elbow', 'hand', 'hand_rot'), angles))
+
+	def get_goals(self, square, height='approach'):
+		# Method to get the goal position register values at a square
+		# Returns tuple of (servo ID, goal position value), or None if the
+		# square is out of reach
+		goals = self.goals_struct.unpack_from(self.data, self.get_offset(square, height) + angles_struct.size)
+		if (goals[0] == unreachable_goal):
+			return None
+		return tuple(zip(self.servo_ids, goals))
+
+def build(servo_ids, get_poses, board=board):
+	# Function to build a table by evaluating every square and height
+	#	servo_ids:	IDs of the servos with goals in the table
+	#	get_poses:	function taking (x, y, z) and returning (angles, goals),
+	#				angles a (rot, elbow, hand, hand_rot) tuple and goals a
+	#				tuple of goal position values in the order of servo_ids,
+	#				or None if the point is out of reach
+	# Returns BoardTable
+
+	goals_struct = struct.Struct("<%dH" % len(servo_ids))
+	unreachable = angles_struct.pack(*([math.nan]*4)) + goals_struct.pack(*([unreachable_goal]*len(servo_ids)))
+
+	parts = [TABLE_MAGIC, table_header.pack(board['columns'], board['rows'], len(height_names), len(servo_ids)), bytes(servo_ids)]
+	for row in range(board['rows']):
+		for column in range(board['columns']):
+			for height in height_names:
+				poses = get_poses(*get_square_position((column, row), height, board))
+				if (poses == None):
+					parts.append(unreachable)
+				else:
+					(angles, goals) = poses
+					parts.append(angles_struct.pack(*angles) + goals_struct.pack(*goals))
+
+	return BoardTable(b"".join(parts))
+
+def save(table, file):
+	# Function to save a table, replacing the file only when it is complete
+	temp_file = file + ".tmp"
+	f = open(temp_file, 'wb')
+	f.write(table.data)
+	f.flush()
+	os.fsync(f.fileno())
+	f.close()
+	os.replace(temp_file, file)
+
+def load(file):
+	# Function to read a table file
+	# Returns BoardTable, or None if the file is missing or corrupted
+	try:
+		f = open(file, 'rb')
+	except FileNotFoundError:
+		return None
+	data = f.read()
+	f.close()
+
+	try:
+		return BoardTable(data)
+	except (ValueError, struct.error):
+		return None
@@ -0,0 +1,159 @@
+'''
+Bus.py
+Date:		17.10.26
+
+Bus owner thread for the AX18A class. The thread is the only one using
+the port and direction pin, and runs submitted transactions in order of
+priority (emergency stop first, telemetry last). Other threads get the
+result back, either by waiting for it (call) or as a future (submit).
+'''
+
+import time
+import queue
+import threading
+from concurrent.futures import Future
+import concurrent.futures
+
+class Bus:
+	# Priorities, lower value is served first
+	emergency = 0
+	motion = 1
+	configuration = 2
+	telemetry = 3
+	priority_names = ('emergency', 'motion', 'configuration', 'telemetry')
+
+	# Raised for transactions cancelled before they ran (see cancel), the
+	# AX18A class raises it as AX18A.CancelledError
+	class CancelledError(Exception) : pass
+
+	def __init__(self):
+		self.queue = queue.PriorityQueue()
+		self.sequence = 0 			# Keeps submission order within a priority
+		self.lock = threading.Lock()
+		self.pending = set() 		# Queued (priority, future) pairs
+		self.thread = None
+		self.running = False
+		self.reset_metrics()
+
+	def start(self):
+		# Method to start the bus thread
+		if (self.running):
+			return
+		self.running = True
+		self.thread = threading.Thread(target=self.run, name="AX18A bus", daemon=True)
+		self.thread.start()
+
+	def stop(self):
+		# Method to stop the bus thread after the transaction being run
+		# Queued transactions are cancelled
+		if (not self.running):
+			return
+		self.running = False
+		self.cancel(range(len(Bus.priority_names)))
+		self.put(-1, None, None, (), {})
+		if (self.thread is not threading.current_thread()):
+			self.thread.join()
+
+	def in_bus_thread(self):
+		# Returns True if called from the bus thread
+		return threading.current_thread() is self.thread
+
+	def put(self, priority, future, function, args, kwargs):
+		with self.lock:
+			self.sequence += 1
+			item = (priority, self.sequence, time.perf_counter(), future, function, args, kwargs)
+			if (future != None):
+				self.pending.add((priority, future))
+				depth = len(self.pending)
+				if (depth > self.metrics['max_depth']):
+					self.metrics['max_depth'] = depth
+		self.queue.put(item)
+
+	def submit(self, priority, function, *args, **kwargs):
+		# Method to queue function to be run by the bus thread
+		#	priority:	Bus.emergency, motion, configuration or telemetry
+		#	function:	function doing the transaction(s)
+		# Returns concurrent.futures.Future for the result of function
+
+		if (not self.running):
+			raise Bus.CancelledError("Bus: bus thread not running")
+
+		future = Future()
+		self.put(priority, future, function, args, kwargs)
+		return future
+
+	def call(self, priority, function, *args, **kwargs):
+		# Method to run function in the bus thread and wait for the result
+		# Exceptions raised by function are raised here, Bus.CancelledError
+		# if the transaction was cancelled before it ran
+		if (self.in_bus_thread()):
+			return function(*args, **kwargs)
+		try:
+			return self.submit(priority, function, *args, **kwargs).result()
+		except concurrent.futures.CancelledError:
+			raise Bus.CancelledError("Bus: transaction cancelled")
+
+	def cancel(self, priorities):
+		# Method to cancel all queued transactions with the given priorities
+		#	priorities:	iterable of priorities, e.g. (Bus.motion,)
+		# Returns number of transactions cancelled
+
+		cancelled = 0
+		with self.lock:
+			for priority, future in list(self.pending):
+				if (priority in priorities and future.cancel()):
+					self.pending.discard((priority, future))
+					cancelled += 1
+		return cancelled
+
+	def run(self):
+		# Bus thread main loop
+		while (True):
+			(priority, _, submit_time, future, function, args, kwargs) = self.queue.get()
+			if (priority < 0):
+				break
+
+			with self.lock:
+				self.pending.discard((priority, future))
+			if (not future.set_running_or_notify_cancel()):
+				continue
+
+			# Record time spent waiting in the queue
+			wait_time = time.perf_counter() - submit_time
+			stats = self.metrics['priorities'][priority]
+			stats['count'] += 1
+			stats['wait_sum'] += wait_time
+			if (wait_time > stats['wait_max']):
+				stats['wait_max'] = wait_time
+
+			try:
+				result = function(*args, **kwargs)
+			except BaseException as err:
+				future.set_exception(err)
+			else:
+				future.set_result(result)
+
+	def get_metrics(self):
+		# Method to get queue metrics
+		# Returns dictionary with current and max queue depth, and for each
+		# priority name the number of transactions run and mean and max
+		# time spent waiting in the queue (seconds)
+
+		with self.lock:
+			metrics = {'depth': len(self.pending), 'max_depth': self.metrics['max_depth']}
+		for priority, name in enumerate(Bus.priority_names):
+			stats = self.metrics['priorities'][priority]
+			count = stats['count']
+			metrics[name] = {
+				'count': count,
+				'wait_mean': stats['wait_sum']/count if count > 0 else 0.0,
+				'wait_max': stats['wait_max']
+			}
+		return metrics
+
+	def reset_metrics(self):
+		# Method to clear the queue metrics
+		self.metrics = {
+			'max_depth': 0,
+			'priorities': [{'count': 0, 'wait_sum': 0.0, 'wait_max': 0.0} for name in Bus.priority_names]
+		}
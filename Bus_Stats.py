@@ -0,0 +1,149 @@
+'''
+Bus_Stats.py
+Date:		17.10.26
+
+Transaction statistics for the AX18A class. Enabled with
+AX18A.enable_stats(), records for each instruction and servo ID the
+number of transactions, latency (histogram, mean, min, max), bytes on
+the wire, retries and errors by type. When disabled (AX18A.stats is None)
+the only cost is one comparison per transaction.
+
+Example:
+	stats = AX18A.enable_stats()
+	arm.get_states()
+	print(stats.snapshot()['instructions']['read_data'])
+'''
+
+import time
+import bisect
+import threading
+
+class BusStats:
+	# Upper bounds of the latency histogram buckets (microseconds), the last
+	# bucket counts everything slower
+	buckets = (50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+	error_types = ('timeout', 'checksum', 'start_signal', 'servo', 'circuit_open', 'other')
+	error_names = {
+		'TimeoutError': 'timeout',
+		'ChecksumError': 'checksum',
+		'StartSignalError': 'start_signal',
+		'ServoError': 'servo',
+		'CircuitOpenError': 'circuit_open'
+	}
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.reset()
+
+	def reset(self):
+		# Method to clear all statistics
+		with self.lock:
+			self.entries = {} 			# (instruction, ID): entry dictionary
+			self.start_time = time.monotonic()
+
+	def get_entry(self, instruction, ID):
+		key = (instruction, ID)
+		entry = self.entries.get(key)
+		if (entry == None):
+			entry = {
+				'count': 0,
+				'latency_sum': 0.0,
+				'latency_min': None,
+				'latency_max': 0.0,
+				'histogram': [0]*(len(BusStats.buckets)+1),
+				'bytes_tx': 0,
+				'bytes_rx': 0,
+				'retries': 0,
+				'errors': dict.fromkeys(BusStats.error_types, 0)
+			}
+			self.entries[key] = entry
+		return entry
+
+	def record(self, instruction, ID, latency, bytes_tx, bytes_rx=0, retries=0):
+		# Method to record a completed transaction
+		#	instruction:	String matching a key from the AX18A.instruction dictionary
+		#	ID:				servo ID
+		#	latency:		time from first instruction byte to complete reply (seconds)
+		#	bytes_tx:		bytes written, including retries
+		#	bytes_rx:		bytes of the status packet, 0 if none
+		#	retries:		number of failed attempts before success
+
+		bucket = bisect.bisect_left(BusStats.buckets, latency*1000000)
+		with self.lock:
+			entry = self.get_entry(instruction, ID)
+			entry['count'] += 1
+			entry['latency_sum'] += latency
+			if (entry['latency_min'] == None or latency < entry['latency_min']):
+				entry['latency_min'] = latency
+			if (latency > entry['latency_max']):
+				entry['latency_max'] = latency
+			entry['histogram'][bucket] += 1
+			entry['bytes_tx'] += bytes_tx
+			entry['bytes_rx'] += bytes_rx
+			entry['retries'] += retries
+
+	def record_error(self, instruction, ID, err):
+		# Method to record a failed attempt
+		#	err:	exception raised (AX18A.CommError or AX18A.ServoError)
+		error_type = BusStats.error_names.get(type(err).__name__, 'other')
+		with self.lock:
+			entry = self.get_entry(instruction, ID)
+			entry['errors'][error_type] += 1
+
+	@staticmethod
+	def summarise(entries):
+		# Method to add up entries into a single entry with mean latency
+		total = {
+			'count': 0,
+			'latency_sum': 0.0,
+			'latency_min': None,
+			'latency_max': 0.0,
+			'histogram': [0]*(len(BusStats.buckets)+1),
+			'bytes_tx': 0,
+			'bytes_rx': 0,
+			'retries': 0,
+			'errors': dict.fromkeys(BusStats.error_types, 0)
+		}
+		for entry in entries:
+			for key in ('count', 'latency_sum', 'bytes_tx', 'bytes_rx', 'retries'):
+				total[key] += entry[key]
+			if (entry['latency_min'] != None and (total['latency_min'] == None or entry['latency_min'] < total['latency_min'])):
+				total['latency_min'] = entry['latency_min']
+			total['latency_max'] = max(total['latency_max'], entry['latency_max'])
+			for i, count in enumerate(entry['histogram']):
+				total['histogram'][i] += count
+			for error_type, count in entry['errors'].items():
+				total['errors'][error_type] += count
+
+		total['latency_mean'] = total['latency_sum']/total['count'] if total['count'] > 0 else 0.0
+		del total['latency_sum']
+		return total
+
+	def snapshot(self):
+		# Method to get a copy of the statistics
+		# Returns dictionary with:
+		#	elapsed:		seconds since statistics were reset
+		#	buckets:		histogram bucket upper bounds (microseconds)
+		#	total:			all transactions
+		#	instructions:	summary for each instruction
+		#	ids:			summary for each servo ID
+		#	transactions:	summary for each (instruction, ID) pair
+
+		with self.lock:
+			entries = {key: dict(entry, histogram=list(entry['histogram']), errors=dict(entry['errors'])) for key, entry in self.entries.items()}
+			elapsed = time.monotonic() - self.start_time
+
+		instructions = {}
+		ids = {}
+		for (instruction, ID), entry in entries.items():
+			instructions.setdefault(instruction, []).append(entry)
+			ids.setdefault(ID, []).append(entry)
+
+		return {
+			'elapsed': elapsed,
+			'buckets': BusStats.buckets,
+			'total': BusStats.summarise(entries.values()),
+			'instructions': {key: BusStats.summarise(value) for key, value in instructions.items()},
+			'ids': {key: BusStats.summarise(value) for key, value in ids.items()},
+			'transactions': {key: BusStats.summarise((entry,)) for key, entry in entries.items()}
+		}
@@ -0,0 +1,194 @@
+'''
+Capture.py
+Date:		17.10.26
+
+Binary capture of the traffic on the servo bus, and replay of a capture
+through a simulated bus. A capture file starts with the 8 byte header
+CAPTURE_MAGIC, followed by one record per write or read:
+
+	direction	1 byte, CAPTURE_TX (instruction packets) or CAPTURE_RX (status packets)
+	timestamp	8 byte float, time.monotonic() in seconds
+	length		2 bytes, number of data bytes
+	data		length bytes as written to or read from the bus
+
+All numbers are little endian. Records are only appended and written to
+the file after each record (or every flush_interval seconds, see
+CaptureWriter), so a capture cut short by a crash is readable up to the
+last record written.
+
+Example:
+	AX18A.start_capture("session.cap")
+	arm.move_to_position("pickup")
+	AX18A.stop_capture()
+	report = Capture.replay("session.cap", speed=10)
+'''
+
+import time
+import struct
+import Transport
+
+CAPTURE_MAGIC = b"AXCAP\x00\x01\n"
+CAPTURE_TX = 0
+CAPTURE_RX = 1
+record_header = struct.Struct("<BdH")
+
+class CaptureWriter:
+	# Append-only writer of capture records
+	#	file:			path of capture file, appended to if it exists
+	#	flush_interval:	longest time (seconds) records are kept in the
+	#					file buffer, 0 to write each record at once
+
+	def __init__(self, file, flush_interval=0):
+		self.file = open(file, "ab")
+		if (self.file.tell() == 0):
+			self.file.write(CAPTURE_MAGIC)
+		self.file.flush()
+		self.flush_interval = flush_interval
+		self.flush_time = time.monotonic()
+		self.records = 0
+
+	def record(self, direction, data, timestamp=None):
+		# Method to append a record, long data is split into several records
+		if (timestamp == None):
+			timestamp = time.monotonic()
+		data = memoryview(data)
+		for i in range(0, len(data), 0xFFFF):
+			chunk = data[i:i+0xFFFF]
+			self.file.write(record_header.pack(direction, timestamp, len(chunk)))
+			self.file.write(chunk)
+			self.records += 1
+		if (timestamp - self.flush_time >= self.flush_interval):
+			self.flush()
+
+	def flush(self):
+		self.file.flush()
+		self.flush_time = time.monotonic()
+
+	def close(self):
+		self.file.close()
+
+class CaptureTransport(Transport.Transport):
+	# Transport recording all bytes written to and read from another
+	# transport, which does the actual communication
+	#	transport:		Transport to record
+	#	file:			path of capture file
+	#	flush_interval:	see CaptureWriter
+
+	def __init__(self, transport, file, flush_interval=0):
+		self.transport = transport
+		self.writer = CaptureWriter(file, flush_interval)
+
+	@property
+	def timeout(self):
+		return self.transport.timeout
+
+	@timeout.setter
+	def timeout(self, value):
+		self.transport.timeout = value
+
+	def write(self, data):
+		self.writer.record(CAPTURE_TX, data)
+		return self.transport.write(data)
+
+	def read(self, size):
+		data = self.transport.read(size)
+		if (len(data) > 0):
+			self.writer.record(CAPTURE_RX, data)
+		return data
+
+	def readinto(self, buffer):
+		received = self.transport.readinto(buffer)
+		if (received > 0):
+			self.writer.record(CAPTURE_RX, memoryview(buffer)[:received])
+		return received
+
+	def flushInput(self):
+		self.transport.flushInput()
+
+	def fileno(self):
+		return self.transport.fileno()
+
+	def set_direction(self, direction):
+		self.transport.set_direction(direction)
+
+	def close(self):
+		# Closes the capture file only, the recorded transport is left open
+		self.writer.close()
+
+def read_capture(file):
+	# Generator of the records in a capture file
+	# Yields (direction, timestamp, data) tuples
+	with open(file, "rb") as f:
+		if (f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC):
+			raise ValueError("read_capture: %s is not a capture file" % file)
+		while (True):
+			header = f.read(record_header.size)
+			if (len(header) < record_header.size):
+				return
+			(direction, timestamp, length) = record_header.unpack(header)
+			data = f.read(length)
+			if (len(data) < length):
+				return 		# Incomplete last record
+			yield (direction, timestamp, data)
+
+def replay(file, speed=1.0, bus=None):
+	# Function to send the instruction packets of a capture through a
+	# simulated bus, keeping the time between them
+	#	file:	path of capture file
+	#	speed:	1 for original speed, 10 for ten times faster, or None to
+	#			send packets back to back
+	#	bus:	SimulatedBus to use, a new one is created if None
+	# The status packets from the simulated bus are compared with those
+	# captured after the same instruction packets.
+	# Returns dictionary with number of records, bytes sent and received,
+	# captured and replayed duration (seconds), number of collisions on the
+	# simulated bus and a list of (timestamp, instruction packets, captured
+	# status packets, replayed status packets) where the replies differ
+
+	if (bus is None):
+		bus = Transport.SimulatedBus(realtime=(speed != None))
+
+	report = {'records': 0, 'tx_bytes': 0, 'rx_bytes': 0, 'captured_duration': 0.0, 'duration': 0.0, 'collisions': 0, 'mismatches': []}
+
+	def compare(timestamp, tx_data, rx_data):
+		# Compare captured replies with the replies of the simulated bus
+		if (tx_data == None):
+			return
+		replayed = bus.read(len(bus.rx_buffer))
+		report['rx_bytes'] += len(replayed)
+		if (replayed != rx_data):
+			report['mismatches'].append((timestamp, tx_data, bytes(rx_data), replayed))
+
+	first_time = None
+	start_time = time.perf_counter()
+	tx_time = None
+	tx_data = None
+	rx_data = bytearray()
+	for direction, timestamp, data in read_capture(file):
+		report['records'] += 1
+		if (first_time == None):
+			first_time = timestamp
+		report['captured_duration'] = timestamp - first_time
+
+		if (direction == CAPTURE_RX):
+			rx_data += data
+			continue
+
+		compare(tx_time, tx_data, rx_data)
+
+		# Wait until the instruction packet is due
+		if (speed != None):
+			delay = start_time + (timestamp - first_time)/speed - time.perf_counter()
+			if (delay > 0):
+				time.sleep(delay)
+
+		tx_time = timestamp
+		tx_data = data
+		rx_data = bytearray()
+		bus.write(data)
+		report['tx_bytes'] += len(data)
+	compare(tx_time, tx_data, rx_data)
+
+	report['duration'] = time.perf_counter() - start_time
+	report['collisions'] = bus.collisions
+	return report
@@ -0,0 +1,152 @@
+'''
+Control_Table.py
+Date:		17.10.26
+
+Control table of the AX-18A, one entry for each register (a 16 bit
+register is one entry, low byte first). The AX18A class generates its
+address dictionary, read_/write_ methods and batched read plans from
+this table at import.
+
+Register fields:
+	name:		register name, 16 bit registers get _l and _h address names
+	address:	address of first (low) byte
+	width:		1 or 2 bytes
+	access:		r (read only) or rw
+	unit:		unit of the converted value, None for register value
+	scale:		(multiplier, divisor), register value is
+				int((value-offset)*multiplier/divisor)
+	offset:		value at register value 0
+	minimum:	smallest value allowed to write (in unit)
+	maximum:	largest value allowed to write (in unit)
+
+Units with special conversions:
+	slope:	compliance slope level 1-7, register value 2**level
+	load:	percent of max load, bit 10 is the direction (CW positive)
+'''
+
+from collections import namedtuple
+
+Register = namedtuple('Register', ('name', 'address', 'width', 'access', 'unit', 'scale', 'offset', 'minimum', 'maximum'))
+
+control_table = (
+	# EEPROM area
+	Register('model_number',					0x00, 2, 'r',	None,		None,			0,	None,	None),
+	Register('version_of_firmware',				0x02, 1, 'r',	None,		None,			0,	None,	None),
+	Register('id',								0x03, 1, 'rw',	None,		None,			0,	0,		252),
+	Register('baud_rate',						0x04, 1, 'rw',	None,		None,			0,	0,		254),
+	Register('return_delay_time',				0x05, 1, 'rw',	'us',		(1, 2),			0,	0,		508),
+	Register('cw_angle_limit',					0x06, 2, 'rw',	'degrees',	(3.41, 1),		30,	30,		330),
+	Register('ccw_angle_limit',					0x08, 2, 'rw',	'degrees',	(3.41, 1),		30,	30,		330),
+	Register('the_highest_limit_temperature',	0x0B, 1, 'rw',	'celsius',	None,			0,	10,		99),
+	Register('the_lowest_limit_voltage',		0x0C, 1, 'rw',	'volts',	(10, 1),		0,	5,		25),
+	Register('the_highest_limit_voltage',		0x0D, 1, 'rw',	'volts',	(10, 1),		0,	5,		25),
+	Register('max_torque',						0x0E, 2, 'rw',	'percent',	(10.23, 1),		0,	0,		100),
+	Register('status_return_level',				0x10, 1, 'rw',	None,		None,			0,	0,		2),
+	Register('alarm_led',						0x11, 1, 'rw',	None,		None,			0,	0,		127),
+	Register('alarm_shutdown',					0x12, 1, 'rw',	None,		None,			0,	0,		127),
+	# RAM area
+	Register('torque_enable',					0x18, 1, 'rw',	None,		None,			0,	0,		1),
+	Register('led',								0x19, 1, 'rw',	None,		None,			0,	0,		1),
+	Register('cw_compliance_margin',			0x1A, 1, 'rw',	'degrees',	(1, 0.29),		0,	0,		73),
+	Register('ccw_compliance_margin',			0x1B, 1, 'rw',	'degrees',	(1, 0.29),		0,	0,		73),
+	Register('cw_compliance_slope',				0x1C, 1, 'rw',	'slope',	None,			0,	1,		7),
+	Register('ccw_compliance_slope',			0x1D, 1, 'rw',	'slope',	None,			0,	1,		7),
+	Register('goal_position',					0x1E, 2, 'rw',	'degrees',	(3.41, 1),		30,	30,		330),
+	Register('moving_speed',					0x20, 2, 'rw',	'rpm',		(1, 0.111),		0,	0,		113.5),
+	Register('torque_limit',					0x22, 2, 'rw',	'percent',	(10.23, 1),		0,	0,		100),
+	Register('present_position',				0x24, 2, 'r',	'degrees',	(3.41, 1),		30,	None,	None),
+	Register('present_speed',					0x26, 2, 'r',	'rpm',		(1, 0.111),		0,	None,	None),
+	Register('present_load',					0x28, 2, 'r',	'load',		None,			0,	None,	None),
+	Register('present_voltage',					0x2A, 1, 'r',	'volts',	(10, 1),		0,	None,	None),
+	Register('present_temperature',				0x2B, 1, 'r',	'celsius',	None,			0,	None,	None),
+	Register('registered',						0x2C, 1, 'r',	None,		None,			0,	None,	None),
+	Register('moving',							0x2E, 1, 'r',	None,		None,			0,	None,	None),
+	Register('lock',							0x2F, 1, 'rw',	None,		None,			0,	0,		1),
+	Register('punch',							0x30, 2, 'rw',	None,		None,			0,	0,		0x3FF)
+)
+
+def get_addresses(table):
+	# Function to get the address of every register byte
+	# Returns dictionary with names as keys, 16 bit registers have a
+	# name_l and name_h entry
+	addresses = {}
+	for register in table:
+		if (register.width == 1):
+			addresses[register.name] = register.address
+		else:
+			addresses[register.name + '_l'] = register.address
+			addresses[register.name + '_h'] = register.address+1
+	return addresses
+
+def get_encoder(register):
+	# Function to make the function converting a value in the register
+	# unit to the register value, checking the range
+	# Returns function raising ValueError if value is out of range
+
+	name = register.name
+	minimum = register.minimum
+	maximum = register.maximum
+	offset = register.offset
+	range_message = "%s must be in range %s-%s" % (name, minimum, maximum)
+
+	if (register.unit == 'slope'):
+		def encode(value):
+			if (not value in range(minimum, maximum+1)):
+				raise ValueError(range_message)
+			return 2**int(value)
+	elif (register.scale == None):
+		def encode(value):
+			if (value < minimum or value > maximum):
+				raise ValueError(range_message)
+			return int(value - offset)
+	else:
+		(multiplier, divisor) = register.scale
+		def encode(value):
+			if (value < minimum or value > maximum):
+				raise ValueError(range_message)
+			return int((value - offset)*multiplier/divisor)
+
+	return encode
+
+def get_decoder(register):
+	# Function to make the function converting a register value to a
+	# value in the register unit
+
+	offset = register.offset
+
+	if (register.unit == 'slope'):
+		def decode(raw):
+			return max(1, raw.bit_length()-1)
+	elif (register.unit == 'load'):
+		def decode(raw):
+			return (raw&0x3FF)/10.23*(-1+2*(raw>>10))
+	elif (register.scale == None):
+		def decode(raw):
+			return raw + offset
+	else:
+		(multiplier, divisor) = register.scale
+		if (multiplier == 1):
+			def decode(raw):
+				return raw*divisor + offset
+		else:
+			def decode(raw):
+				return raw*divisor/multiplier + offset
+
+	return decode
+
+def get_read_plan(registers, max_gap=8):
+	# Function to group registers into blocks read with one read data each.
+	# Registers less than max_gap bytes apart share a block, since the
+	# extra bytes cost less than another instruction and status packet
+	#	registers:	Register tuples
+	# Returns tuple of (address, length, registers) blocks
+
+	blocks = []
+	for register in sorted(set(registers), key=lambda register: register.address):
+		end = register.address + register.width
+		if (len(blocks) > 0 and register.address - (blocks[-1][0] + blocks[-1][1]) <= max_gap):
+			(address, length, members) = blocks[-1]
+			blocks[-1] = (address, max(length, end-address), members + (register,))
+		else:
+			blocks.append((register.address, register.width, (register,)))
+	return tuple(blocks)
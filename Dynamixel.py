@@ -6,9 +6,60 @@ Date:		05.02.17
 Class for communicating with the Dynamixel AX-18A servo 
 '''
 
+import os
 import time
-from serial import Serial
-import RPi.GPIO as GPIO
+import struct
+import weakref
+import threading
+import functools
+from collections import namedtuple
+import Transport
+import Capture
+import Control_Table
+from Bus import Bus
+from Bus_Stats import BusStats
+from Retry_Policy import RetryPolicy
+
+def bus_transaction(priority):
+	# Decorator for AX18A methods using the bus. If the bus thread is running
+	# (see AX18A.start_bus) the method is run by the bus thread, otherwise
+	# it is run here while holding AX18A.bus_lock
+	#	priority:	Bus priority, or function of the method arguments
+	#				returning the priority
+
+	def decorator(method):
+		@functools.wraps(method)
+		def submitter(*args, **kwargs):
+			bus = AX18A.bus
+			if (bus == None):
+				with AX18A.bus_lock:
+					return method(*args, **kwargs)
+			if (bus.in_bus_thread()):
+				return method(*args, **kwargs)
+
+			try:
+				if (callable(priority)):
+					return bus.call(priority(*args, **kwargs), method, *args, **kwargs)
+				return bus.call(priority, method, *args, **kwargs)
+			except Bus.CancelledError as err:
+				# Have the bus thread drop any unread input before the next
+				# transaction, the bus may have been stopped already
+				try:
+					bus.submit(Bus.emergency, AX18A.flush_input)
+				except Bus.CancelledError:
+					pass
+				# Raised as a CommError so callers handling those also handle
+				# cancelled transactions
+				ID = args[0].id if len(args) > 0 and isinstance(args[0], AX18A) else AX18A.broadcasting_id
+				raise AX18A.CancelledError(ID, err.args[0])
+		return submitter
+	return decorator
+
+def write_priority(servo, address, *parameters):
+	# Goal position and moving speed writes are motion, others configuration
+	if (address <= 0x21 and address+len(parameters) > 0x1E):
+		return Bus.motion
+	return Bus.configuration
 
 class AX18A:
 	# AX-12A constants
@@ -23,51 +74,8 @@ class AX18A:
 	}
 	broadcasting_id = 0xFE
 
-	address = {
-		'model_number_l': 0x00,
-		'model_number_h': 0x01,
-		'version_of_firmware': 0x02,
-		'id': 0x03,
-		'baud_rate': 0x04,
-		'return_delay_time': 0x05,
-		'cw_angle_limit_l': 0x06,
-		'cw_angle_limit_h': 0x07,
-		'ccw_angle_limit_l': 0x08,
-		'ccw_angle_limit_h': 0x09,
-		'the_highest_limit_temperature': 0x0B,
-		'the_lowest_limit_voltage': 0x0C,
-		'the_highest_limit_voltage': 0x0D,
-		'max_torque_l': 0x0E,
-		'max_torque_h': 0x0F,
-		'status_return_level': 0x10,
-		'alarm_led': 0x11,
-		'alarm_shutdown': 0x12,
-		'torque_enable': 0x18,
-		'led': 0x19,
-		'cw_compliance_margin': 0x1A,
-		'ccw_compliance_margin': 0x1B,
-		'cw_compliance_slope': 0x1C,
-		'ccw_compliance_slope': 0x1D,
-		'goal_position_l': 0x1E,
-		'goal_position_h': 0x1F,
-		'moving_speed_l': 0x20,
-		'moving_speed_h': 0x21,
-		'torque_limit_l': 0x22,
-		'torque_limit_h': 0x23,
-		'present_position_l': 0x24,
-		'present_position_h': 0x25,
-		'present_speed_l': 0x26,
-		'present_speed_h': 0x27,
-		'present_load_l': 0x28,
-		'present_load_h': 0x29,
-		'present_voltage': 0x2A,
-		'present_temperature': 0x2B,
-		'registered': 0x2C,
-		'moving': 0x2E,
-		'lock': 0x2F,
-		'punch_l': 0x30,
-		'punch_h': 0x31
-	}
+	# Register addresses, 16 bit registers have a _l and _h entry
+	address = Control_Table.get_addresses(Control_Table.control_table)
 
 	# AX-12A return error bits
 	return_error = {
@@ -106,98 +114,416 @@ class AX18A:
 	GPIO_direction_TX = 1
 	GPIO_direction_RX = 0
 
-	port = None			# Common port object
-	retry_delay = 0.01
+	port = None			# Common port object (Transport instance)
+	bus = None 			# Bus thread owning the port, None if not started
+	bus_lock = threading.RLock() # Held during transactions if no bus thread
+	rx_buffer = bytearray(512)	# Persistent receive buffer for status packets
+	rx_view = memoryview(rx_buffer)
+	rx_start = 0 		# Index of first unread byte in receive buffer
+	status_header_length = 5 	# [0xFF, 0xFF, id, length, error]
+	rx_end = 0 			# Index after last received byte
+	retry_policy = RetryPolicy() 	# Retries, backoff and circuit breaker for transactions
+	default_timeout = 0.1 		# Read timeout for servos not calibrated (seconds)
+	timeout_factor = 3 			# Safety factor on measured latency for read timeouts
+	min_timeout = 0.002 		# Smallest read timeout (seconds)
+	byte_time = 10/1000000 		# Time of one byte on the wire at 1 Mbps (seconds)
+	return_delay_steps = (250, 100, 50, 20, 10, 5, 2, 1, 0) # Calibration candidates
+	return_delay_margin = 5 	# Register units (2 us) added to calibrated return delay
+	pipeline_guard = 20e-6 		# Idle bus time between pipelined packets (seconds)
+	# Scan timeout: max return delay (508 us), instruction and reply on the
+	# wire and 1 ms for the host
+	scan_timeout = 508e-6 + 17*byte_time + 0.001
+	scan_cache_file = "servos.txt"
+	wait_spin_threshold = 0.0005	# Last part of wait that is busy waited (seconds)
+	wait_record_jitter = True 		# Record statistics of wait lateness
+	wait_jitter = {'count': 0, 'sum': 0.0, 'sum_squares': 0.0, 'max': 0.0}
+	default_transport = os.environ.get('AX18A_TRANSPORT', 'serial')
+	stats = None 		# BusStats recording transactions, None if disabled
 
 	class CommError(Exception) : pass
 	class ServoError(Exception) : pass
 	class TimeoutError(CommError) : pass
 	class StartSignalError(CommError) : pass
 	class ChecksumError(CommError) : pass
+	class CircuitOpenError(CommError) : pass
+	class CancelledError(CommError) : pass 	# Transaction cancelled in the bus queue
 	class ParameterError(Exception) : pass
 
+	# Register cache. Each register address belongs to a class deciding how
+	# long a value read from or written to the servo is trusted:
+	#	eeprom:		EEPROM area, only changed by writes (0x00-0x17)
+	#	ram:		RAM settings only changed by writes (compliance, moving
+	#				speed, lock, punch)
+	#	volatile:	values the servo changes itself (present state,
+	#				registered, moving, torque enable, torque limit) and goal
+	#				position, which must be sent again if an alarm has turned
+	#				torque off
+	# cache_max_age gives the max age in seconds for each class, None to
+	# trust values until written or invalidated, 0 to never trust them
+	cache_enabled = True
+	register_class = ('eeprom',)*0x18 + ('volatile',) + ('ram',)*5 + ('volatile',)*2 + ('ram',)*2 + ('volatile',)*13 + ('ram',)*3
+	cache_max_age = {'eeprom': None, 'ram': None, 'volatile': 0}
+	cache_stats = {'read_hits': 0, 'read_misses': 0, 'write_hits': 0, 'write_misses': 0}
+	instances = weakref.WeakSet()	# All servo instances, updated by broadcast writes
+
+	# Register regions (start, length) fetched as a whole on first use
+	register_regions = ((0x00, 0x18), (0x18, 0x1A))
+	snapshot_file = "registers.txt" 	# Saved EEPROM register values
+	snapshots = None 					# Loaded from snapshot_file on first use
+
+	# Factory default register values
+	default_register = (
+		0x12, 0x00, 0x00, 0x01, 0x01, 0xFA, 0x00, 0x00, 0xFF, 0x03,
+		0x00, 0x46, 0x3C, 0x8C, 0xD7, 0x03, 0x02, 0x24, 0x24, 0x00,
+		0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x01, 0x01, 0x20, 0x20,
+		0x00, 0x00, 0x00, 0x00, 0xD7, 0x03, 0x00, 0x00, 0x00, 0x00,
+		0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x20, 0x00
+	)
+
+	# Record of the present state block (registers 0x24-0x2B)
+	State = namedtuple('State', ('position', 'speed', 'load', 'voltage', 'temperature'))
+	state_struct = struct.Struct('<HHHBB')
+	word = struct.Struct('<H') 		# 16 bit register value, low byte first
+	state_address = 0x24
+	state_length = 8
+
+	# Control table schema, with encode_<name> and decode function for each
+	# register added by add_register_methods. read_plans keeps the blocks
+	# to read for each tuple of register names (see get_read_plan)
+	registers = {register.name: register for register in Control_Table.control_table}
+	decoders = {}
+	read_plans = {}
+	read_plan_gap = 8 	# Max unused bytes between registers read in one block
+	torque_address = registers['torque_enable'].address
+	level_address = registers['status_return_level'].address
+
+	# Instruction packets without variable data are built once and kept in
+	# packet_cache with (ID, instruction, address, length) as keys. Goal
+	# position writes (goal position and moving speed, 4 bytes) use a
+	# template for each (ID, instruction) where only the data bytes and
+	# checksum are changed
+	packet_cache = {}
+	fixed_instructions = frozenset(('ping', 'read_data', 'action', 'reset'))
+	goal_templates = {}
+	goal_instructions = frozenset(('write_data', 'reg_write'))
+	goal_address = registers['goal_position'].address
+
 # ---------------------------------------------
 # ---------- INIT AND SETUP METHODS -----------
 # ---------------------------------------------
 
-	def __init__(self, ID):
-		# Setup GPIO and port if not already set up
+	# No instance dictionary, the register values are kept in a 50 byte
+	# bytearray (register) and their read/write times in register_time
+	__slots__ = ('id', 'latency', 'register', 'register_time', 'registered_write', '__weakref__')
+
+	def __init__(self, ID, check=True):
+		# Register values are not read from the servo here, but fetched
+		# by region on first use (see hydrate) or taken from the EEPROM
+		# snapshot of an earlier run
+		#	ID:		servo ID
+		#	check:	if True, model number and firmware are read to check
+		#			the servo is present and the EEPROM snapshot still matches
+
+		# Setup port if not already set up
 		if (AX18A.port == None):
-			GPIO.setwarnings(False)
-			GPIO.setmode(GPIO.BCM)
-			GPIO.setup(AX18A.GPIO_direction, GPIO.OUT)
-			AX18A.port = Serial("/dev/ttyAMA0", baudrate=1000000, timeout=0.1)
+			AX18A.set_transport(AX18A.default_transport)
 
 		# Set own ID
 		self.id = ID
+
+		# Measured round trip time beyond wire and return delay time (seconds),
+		# None until calibrated, see AX18A.calibrate
+		self.latency = None
+
+		# (address, values) sent with reg_write, stored in the register
+		# list when action is sent
+		self.registered_write = None
 		
 		if (self.id != AX18A.broadcasting_id):
 			# Setup default register values
-			self.register = [
-				0x12,
-				0x00, 
-				0x00,
-				self.id,
-				0x01,
-				0xFA,
-				0x00,
-				0x00,
-				0xFF,
-				0x03,
-				0x00,
-				0x46,
-				0x3C,
-				0x8C,
-				0xD7,
-				0x03,
-				0x02,
-				0x24,
-				0x24,
-				0x00,
-				0x00,
-				0x00,
-				0x00,
-				0x00,
-				0x00,
-				0x00,
-				0x01,
-				0x01,
-				0x20,
-				0x20,
-				0x00,
-				0x00,
-				0x00,
-				0x00,
-				0xD7,
-				0x03,
-				0x00,
-				0x00,
-				0x00,
-				0x00,
-				0x00,
-				0x00,
-				0x00,
-				0x00,
-				0x00,
-				0x00,
-				0x00,
-				0x00,
-				0x20,
-				0x00
-			]
-
-			# Get actual register values from servo
-			self.update_register()
+			self.register = bytearray(AX18A.default_register)
+			self.register[AX18A.address['id']] = self.id
+
+			# Time each register value was read or written, None if not known
+			self.register_time = [None]*50
+			AX18A.instances.add(self)
+
+			if (check):
+				identity = self.read_data(AX18A.address['model_number_l'], 3, use_cache=False)
+				self.load_snapshot(identity[1] << 8 | identity[0], identity[2])
+
+	@staticmethod
+	def set_transport(transport, **kwargs):
+		# Method to select the transport used by all servos
+		#	transport:	Transport instance or name of transport (serial, pty or sim)
+		#	**kwargs:	passed on to the transport constructor if name given
+		# Default transport can also be set with the AX18A_TRANSPORT environment variable
+
+		if (isinstance(transport, str)):
+			if (transport == 'serial'):
+				kwargs.setdefault('direction_pin', AX18A.GPIO_direction)
+			try:
+				transport = Transport.get_transport(transport, **kwargs)
+			except KeyError:
+				raise AX18A.ParameterError(0xFF, "set_transport: transport must be serial, pty or sim")
+
+		# Close previous transport
+		AX18A.stop_capture()
+		if (AX18A.port is not None and AX18A.port is not transport):
+			AX18A.port.close()
+
+		AX18A.port = transport
+
+	@staticmethod
+	def start_bus():
+		# Method to start a bus thread that owns the port. Transactions from
+		# all threads are then queued and run in order of priority, see Bus
+		# Returns the Bus object, which also has submit for getting futures
+		# and get_metrics for queue depth and wait times
+
+		if (AX18A.port == None):
+			AX18A.set_transport(AX18A.default_transport)
+		if (AX18A.bus == None):
+			AX18A.bus = Bus()
+			AX18A.bus.start()
+		return AX18A.bus
+
+	@staticmethod
+	def stop_bus():
+		# Method to stop the bus thread, queued transactions are cancelled
+		if (AX18A.bus != None):
+			bus = AX18A.bus
+			AX18A.bus = None
+			bus.stop()
+
+	@staticmethod
+	def emergency_stop():
+		# Method to turn off torque of all servos as soon as possible.
+		# With a bus thread, queued motion transactions are cancelled and the
+		# stop is run before anything else still queued
+
+		brod = AX18A(AX18A.broadcasting_id)
+		if (AX18A.bus == None):
+			brod.set_torque_enable(False)
+		else:
+			AX18A.bus.cancel((Bus.motion,))
+			AX18A.bus.call(Bus.emergency, brod.set_torque_enable, False)
+
+	@staticmethod
+	def start_capture(file, flush_interval=0):
+		# Method to record all traffic on the bus to a binary capture file,
+		# which can be replayed with Capture.replay
+		#	file:			path of capture file, appended to if it exists
+		#	flush_interval:	see Capture.CaptureWriter
+
+		if (AX18A.port == None):
+			AX18A.set_transport(AX18A.default_transport)
+		AX18A.stop_capture()
+		AX18A.port = Capture.CaptureTransport(AX18A.port, file, flush_interval)
+
+	@staticmethod
+	def stop_capture():
+		# Method to stop recording traffic and close the capture file
+		if (isinstance(AX18A.port, Capture.CaptureTransport)):
+			capture = AX18A.port
+			AX18A.port = capture.transport
+			capture.close()
+
+	@staticmethod
+	def enable_stats():
+		# Method to start recording transaction statistics (latency, bytes,
+		# retries and errors for each instruction and servo ID)
+		# Returns the BusStats object, use snapshot() to get the statistics
+		if (AX18A.stats == None):
+			AX18A.stats = BusStats()
+		return AX18A.stats
+
+	@staticmethod
+	def disable_stats():
+		# Method to stop recording transaction statistics
+		# Returns the BusStats object with the statistics recorded so far
+		stats = AX18A.stats
+		AX18A.stats = None
+		return stats
 
 	def update_register(self):
 		# Method to read the whole servo register into the local register list
 
-		# Read all values from servo
-		rx_register = self.read_data(0x00, 50)
+		# Read all values from servo, updating the register list
+		self.read_data(0x00, 50, use_cache=False)
+		self.save_snapshot()
+
+	def hydrate(self, address, length=1):
+		# Method to make sure local register values have been read from the
+		# servo at least once, reading the whole register region (EEPROM or
+		# RAM) they are in if not
+		#	address:	start address of values needed
+		#	length:		number of values needed
+
+		for region_start, region_length in AX18A.register_regions:
+			region_end = region_start+region_length
+			if (address < region_end and address+length > region_start):
+				start = max(address, region_start)
+				end = min(address+length, region_end)
+				if (None in self.register_time[start:end]):
+					self.read_data(region_start, region_length, use_cache=False)
+					if (region_start == 0):
+						self.save_snapshot()
+
+	def load_snapshot(self, model, firmware):
+		# Method to use the saved EEPROM register values of this servo,
+		# if the saved model number and firmware match
+		#	model:		model number read from servo
+		#	firmware:	firmware version read from servo
+		# Returns True if snapshot used
+
+		snapshot = AX18A.get_snapshots().get(self.id)
+		if (snapshot == None or (snapshot[1] << 8 | snapshot[0]) != model or snapshot[2] != firmware):
+			return False
+
+		self.store_register(0, snapshot)
+		return True
+
+	def save_snapshot(self):
+		# Method to save the EEPROM register values of this servo to
+		# AX18A.snapshot_file, if they are all known
+
+		eeprom_length = AX18A.register_regions[0][1]
+		if (None in self.register_time[0:eeprom_length]):
+			return
+
+		snapshots = AX18A.get_snapshots()
+		snapshots[self.register[AX18A.address['id']]] = list(self.register[0:eeprom_length])
+
+		file_str = ""
+		for ID, values in sorted(snapshots.items()):
+			file_str += str(ID) + ":" + ",".join(str(value) for value in values) + "\n"
+
+		f = open(AX18A.snapshot_file, 'w')
+		f.write(file_str)
+		f.close()
+
+	@staticmethod
+	def get_snapshots():
+		# Method to get the saved EEPROM register values of all servos
+		# Each line of the snapshot file is id:value,value,...
+		# Returns dictionary of register value lists with IDs as keys
+
+		if (AX18A.snapshots == None):
+			AX18A.snapshots = {}
+			try:
+				f = open(AX18A.snapshot_file, 'r')
+			except FileNotFoundError:
+				return AX18A.snapshots
 
-		# Update register list
-		for i, value in enumerate(rx_register):
-			self.register[i] = value
+			file_str = f.read()
+			f.close()
+
+			eeprom_length = AX18A.register_regions[0][1]
+			try:
+				for line in file_str.splitlines():
+					ID, values = line.split(":")
+					values = [int(value) for value in values.split(",")]
+					if (len(values) == eeprom_length):
+						AX18A.snapshots[int(ID)] = values
+			except ValueError:
+				AX18A.snapshots = {}
+
+		return AX18A.snapshots
+
+	def store_register(self, address, values, written=False):
+		# Method to update the local register list and register cache with
+		# values read from or written to the servo
+		#	address:	start address of values
+		#	values:		register values
+		#	written:	True if values were written, to apply side effects
+		#				of the write to other registers
+
+		now = time.perf_counter()
+		end = address+len(values)
+		self.register[address:end] = values
+		for i in range(address, end):
+			self.register_time[i] = now
+
+		if (written):
+			# Keep EEPROM snapshot up to date
+			if (address < AX18A.register_regions[0][1]):
+				self.save_snapshot()
+
+			goal_address = AX18A.goal_address
+			torque_address = AX18A.torque_address
+			if (address <= goal_address+1 and end > goal_address):
+				# Writing goal position turns torque on
+				self.register[torque_address] = 1
+			elif (address <= torque_address < end and self.register[torque_address] == 0):
+				# Goal position must be sent again after torque is turned off
+				self.invalidate_register(goal_address, 2)
+
+	def get_register_word(self, address):
+		# Method to get a 16 bit value from the local register
+		#	address:	address of the low byte
+		return AX18A.word.unpack_from(self.register, address)[0]
+
+	def set_register_word(self, address, value):
+		# Method to set a 16 bit value in the local register, without
+		# writing it to the servo
+		#	address:	address of the low byte
+		AX18A.word.pack_into(self.register, address, value)
+
+	def copy_register(self):
+		# Method to get a copy of the local register values (bytes)
+		return bytes(self.register)
+
+	def invalidate_register(self, address, length=1):
+		# Method to mark local register values as unknown, so they are
+		# read from and written to the servo again
+
+		for i in range(address, address+length):
+			self.register_time[i] = None
+
+	def is_cached(self, address, length):
+		# Method to check if local register values can be trusted
+		# according to the register cache, see AX18A.cache_max_age
+		# Returns True if all values from address can be used
+
+		if (not AX18A.cache_enabled or self.id == AX18A.broadcasting_id):
+			return False
+
+		now = time.perf_counter()
+		for i in range(address, address+length):
+			read_time = self.register_time[i]
+			if (read_time == None):
+				return False
+			max_age = AX18A.cache_max_age[AX18A.register_class[i]]
+			if (max_age != None and now - read_time >= max_age):
+				return False
+
+		return True
+
+	def is_unchanged(self, address, values):
+		# Method to check if writing values would not change the servo,
+		# because the same values are cached. Counts write cache hits and misses
+		# Returns True if the write can be skipped
+
+		if (self.is_cached(address, len(values)) and
+			all(self.register[address+i] == value for i, value in enumerate(values))):
+			AX18A.cache_stats['write_hits'] += 1
+			return True
+
+		AX18A.cache_stats['write_misses'] += 1
+		return False
+
+	@staticmethod
+	def get_cache_stats():
+		# Method to get register cache hit and miss counters
+		# Returns copy of AX18A.cache_stats
+		return dict(AX18A.cache_stats)
+
+	@staticmethod
+	def reset_cache_stats():
+		# Method to set all register cache counters to 0
+		for key in AX18A.cache_stats:
+			AX18A.cache_stats[key] = 0
 
 # ---------------------------------------------
 # ----------- EASE OF LIFE METHODS ------------
@@ -207,15 +533,53 @@ class AX18A:
 	def wait(s):
 		# Method for waiting s seconds
 		#	s: seconds to wait, can be floating point
+		# Sleeps until AX18A.wait_spin_threshold seconds are left, then
+		# busy waits the rest for precise timing without using a whole
+		# CPU core for long waits
 
 		start_time = time.perf_counter()		# Get initial time
 		target_time = start_time+s 				# Calculate target time to hit
 
+		# Coarse sleep, leaving the spin threshold to busy wait
+		sleep_time = s - AX18A.wait_spin_threshold
+		if (sleep_time > 0):
+			time.sleep(sleep_time)
+
 		current_time = time.perf_counter() 		# Get current time
 		while(current_time < target_time):		# Check if target time reached
 			current_time = time.perf_counter()	# If target time not reached,
 												# get current time again
 
+		# Record how late the wait finished
+		if (AX18A.wait_record_jitter):
+			jitter = current_time - target_time
+			stats = AX18A.wait_jitter
+			stats['count'] += 1
+			stats['sum'] += jitter
+			stats['sum_squares'] += jitter*jitter
+			if (jitter > stats['max']):
+				stats['max'] = jitter
+
+	@staticmethod
+	def get_wait_jitter():
+		# Method to get statistics of how late AX18A.wait has finished
+		# Returns dictionary with count and mean, standard deviation and
+		# max lateness in seconds
+
+		stats = AX18A.wait_jitter
+		count = stats['count']
+		if (count == 0):
+			return {'count': 0, 'mean': 0.0, 'std': 0.0, 'max': 0.0}
+
+		mean = stats['sum']/count
+		variance = max(stats['sum_squares']/count - mean*mean, 0.0)
+		return {'count': count, 'mean': mean, 'std': variance**0.5, 'max': stats['max']}
+
+	@staticmethod
+	def reset_wait_jitter():
+		# Method to clear the wait jitter statistics
+		AX18A.wait_jitter = {'count': 0, 'sum': 0.0, 'sum_squares': 0.0, 'max': 0.0}
+
 	@staticmethod
 	def checksum(data):
 		# Method to calculate checksum for an instruction packet, data.
@@ -242,29 +606,95 @@ class AX18A:
 		#	direction: either AX18A.GPIO_direction_RX
 		#				or AX18A.GPIO_direction_TX
 
-		GPIO.output(AX18A.GPIO_direction, direction)
+		AX18A.port.set_direction(direction)
 
 	@staticmethod
-	def get_status_packet():
+	def get_status_packet(ID=None, nParams=0, timeout=None):
 		# Method to get incomming status packet
+		# Bytes are read into the persistent receive buffer with two reads:
+		# the 5 byte header [0xFF, 0xFF, id, length, error], then the rest of
+		# the packet as given by its length byte. Asking for the whole
+		# expected packet at once would wait out the timeout for error
+		# replies, which have no parameters. Noise before the start signal
+		# is skipped, and packets from other IDs (late replies) are dropped.
+		#	ID:			expected servo ID, None to accept any ID
+		#	nParams:	expected number of parameters in the status packet
+		#	timeout:	read timeout in seconds, port timeout is kept if None
+		# Returns the status packet (bytes)
 
 		# Set direction pin
 		AX18A.set_direction(AX18A.GPIO_direction_RX)
 
-		# Read 5 first bytes [0xFF, 0xFF, id, length, error]
-		reply = AX18A.port.read(5)
+		# Only change timeout when needed, as it reconfigures a serial port
+		if (timeout != None and AX18A.port.timeout != timeout):
+			AX18A.port.timeout = timeout
+
+		buf = AX18A.rx_buffer
+		needed = AX18A.status_header_length 	# Bytes needed for the header
+		noise = False 		# Set if bytes before start signal were skipped
+
+		while (True):
+			start = AX18A.rx_start
+			available = AX18A.rx_end - start
+
+			# Find start signal [0xFF, 0xFF, id] (id is never 0xFF)
+			idx = buf.find(b"\xFF\xFF", start, AX18A.rx_end)
+			while (idx >= 0 and idx+2 < AX18A.rx_end and buf[idx+2] == 0xFF):
+				idx += 1
+			if (idx < 0):
+				# Keep a trailing 0xFF as it might be the first start byte
+				if (available > 0):
+					noise = noise or available > 1 or buf[start] != 0xFF
+					if (buf[AX18A.rx_end-1] == 0xFF):
+						AX18A.rx_start = AX18A.rx_end-1
+					else:
+						AX18A.rx_start = AX18A.rx_end
+				AX18A.receive(needed - (AX18A.rx_end - AX18A.rx_start), noise)
+				continue
+			if (idx > start):
+				noise = True
+				AX18A.rx_start = start = idx
+				available = AX18A.rx_end - start
+
+			# Read [id, length, error] if not yet received
+			if (available < AX18A.status_header_length):
+				AX18A.receive(needed - available, noise)
+				continue
+
+			packet_length = buf[start+3]+4
+			if (available < packet_length):
+				AX18A.receive(packet_length - available, noise)
+				continue
+
+			# Whole packet received, copy it out of the buffer since the
+			# buffer is reused by the next receive
+			status_packet = bytes(AX18A.rx_view[start:start+packet_length])
+			AX18A.rx_start = start+packet_length
+
+			AX18A.check_status_checksum(status_packet)
+
+			# Drop late replies from other servos
+			if (ID != None and status_packet[2] != ID):
+				continue
+
+			AX18A.check_status_error(status_packet)
+			if (packet_length != nParams+6):
+				raise AX18A.CommError(0xFF, "get_status_packet: Wrong number of parameters")
+			return status_packet
 
-		# Check that input is present and correct
-		try:
-			assert (reply[0] == 0xFF) and (reply[1] == 0xFF)
-		except IndexError:
-			raise AX18A.TimeoutError(0xFF, "get_status_packet: Timeout error")
-		except AssertionError:
-			raise AX18A.StartSignalError(0xFF, "get_status_packet: Start signal incorrect")
+	@staticmethod
+	def check_status_checksum(status_packet):
+		# Method to raise ChecksumError if the checksum of a complete
+		# status packet is incorrect
+		packet_length = len(status_packet)
+		if (((~sum(status_packet[2:packet_length-1])) & 0xFF) != status_packet[packet_length-1]):
+			raise AX18A.ChecksumError(0xFF, "get_status_packet: Checksum error")
 
-		length = reply[3] - 2 	# Convert length byte to indicate number of parameters
-		error = reply[4]		# Get the error byte
+	@staticmethod
+	def check_status_error(status_packet):
+		# Method to raise ServoError if the status packet has an error set
 
+		error = status_packet[4]		# Get the error byte
 		if (error != 0):
 			# Create error tuple
 			error_tuple = AX18A.get_error_tuple(error)
@@ -273,25 +703,36 @@ class AX18A:
 			error_message = "get_status_packet: Received error: " + str(error_tuple)
 			raise AX18A.ServoError(0xFF, error_message, error)
 
-		# Read parameters
-		parameters = AX18A.port.read(length)
-		# Make sure parameters properly read
-		if (len(parameters) < length):
-			raise AX18A.TimeoutError(0xFF, "get_status_packet: Timeout error")
-		# Read checksum
-		received_checksum = AX18A.port.read(1)
-		# Make sure checksum properly read
-		if (len(received_checksum) < 1):
+	@staticmethod
+	def receive(size, noise=False):
+		# Method to read size more bytes from the port into the receive buffer
+		# with a single readinto call
+		#	noise: 	True if noise has been received, a timeout is then
+		#			reported as incorrect start signal
+
+		# Move unread data to start of buffer if there is not enough space
+		if (AX18A.rx_end+size > len(AX18A.rx_buffer)):
+			unread = AX18A.rx_end - AX18A.rx_start
+			AX18A.rx_buffer[0:unread] = AX18A.rx_view[AX18A.rx_start:AX18A.rx_end]
+			AX18A.rx_start = 0
+			AX18A.rx_end = unread
+			if (unread+size > len(AX18A.rx_buffer)):
+				raise AX18A.CommError(0xFF, "get_status_packet: Receive buffer full")
+
+		received = AX18A.port.readinto(AX18A.rx_view[AX18A.rx_end:AX18A.rx_end+size])
+		AX18A.rx_end += received
+
+		if (received < size):
+			if (noise):
+				raise AX18A.StartSignalError(0xFF, "get_status_packet: Start signal incorrect")
 			raise AX18A.TimeoutError(0xFF, "get_status_packet: Timeout error")
 
-		status_packet = reply + parameters + received_checksum 	# Assemble status packet
-		calculated_checksum = AX18A.checksum(status_packet)		# Get expected checksum
-
-		# Check correct checksum and return status packet if correct
-		if (calculated_checksum == received_checksum[0]):
-			return status_packet
-		else:
-			raise AX18A.ChecksumError(0xFF, "get_status_packet: Checksum error")
+	@staticmethod
+	def flush_input():
+		# Method to drop all unread input, both in the port and in the receive buffer
+		AX18A.port.flushInput()
+		AX18A.rx_start = 0
+		AX18A.rx_end = 0
 
 	@staticmethod
 	def get_parameters_from_status_packet(status_packet):
@@ -328,6 +769,52 @@ class AX18A:
 		#	parameters: All parameters to be included in the instruction packet
 		# returns the instruction packet (bytearray)
 
+		# Constant packet, take from cache
+		if (instruction in AX18A.fixed_instructions):
+			key = (self.id, instruction, *parameters)
+			packet = AX18A.packet_cache.get(key)
+			if (packet == None):
+				packet = bytes(AX18A.build_instruction_packet(self.id, instruction, parameters))
+				AX18A.packet_cache[key] = packet
+			return packet
+
+		# Goal position write, patch template
+		if (len(parameters) == 5 and parameters[0] == AX18A.goal_address and instruction in AX18A.goal_instructions):
+			return AX18A.get_goal_packet(self.id, instruction, *parameters[1:])
+
+		return AX18A.build_instruction_packet(self.id, instruction, parameters)
+
+	@staticmethod
+	def get_goal_packet(ID, instruction, angle_l, angle_h, speed_l, speed_h):
+		# Method to get the instruction packet writing the goal position and
+		# moving speed registers from the template of servo ID
+		#	instruction:	write_data or reg_write
+		# The returned bytearray is changed by the next call for the same
+		# servo and instruction, so it must be sent before that
+
+		template = AX18A.goal_templates.get((ID, instruction))
+		if (template == None):
+			packet = AX18A.build_instruction_packet(ID, instruction, (AX18A.goal_address, 0, 0, 0, 0))
+			template = (packet, sum(packet[2:6]))
+			AX18A.goal_templates[(ID, instruction)] = template
+
+		(packet, base_sum) = template
+		try:
+			packet[6] = angle_l
+			packet[7] = angle_h
+			packet[8] = speed_l
+			packet[9] = speed_h
+		except ValueError:
+			raise AX18A.ParameterError(ID, "get_instruction_packet: A value was larger than one byte")
+		packet[10] = ~(base_sum + angle_l + angle_h + speed_l + speed_h) & 0xFF
+		return packet
+
+	@staticmethod
+	def build_instruction_packet(ID, instruction, parameters):
+		# Method to create the instruction packet for any servo ID
+		#	ID: servo ID the packet is sent to
+		# See get_instruction_packet
+
 		# Get length value (number of parameters * 2)
 		nParams = len(parameters)
 		length = nParams+2
@@ -336,7 +823,7 @@ class AX18A:
 		try:
 			instruction_packet[0] = 0xFF			# Start byte one
 			instruction_packet[1] = 0xFF			# Start byte two
-			instruction_packet[2] = self.id 		# Servo ID
+			instruction_packet[2] = ID 		# Servo ID
 			instruction_packet[3] = length 			# Length value (Nparameters+2)
 			instruction_packet[4] = AX18A.instruction[instruction] # Instruction value
 			# Add all parameter bytes
@@ -348,9 +835,9 @@ class AX18A:
 			instruction_packet[i] = AX18A.checksum(instruction_packet)
 
 		except ValueError:
-			raise AX18A.ParameterError(self.id, "get_instruction_packet: A value was larger than one byte")
+			raise AX18A.ParameterError(ID, "get_instruction_packet: A value was larger than one byte")
 		except KeyError:
-			raise AX18A.ParameterError(self.id, "get_instruction_packet: Instruction key not valid")
+			raise AX18A.ParameterError(ID, "get_instruction_packet: Instruction key not valid")
 		else:
 			return instruction_packet
 
@@ -358,265 +845,469 @@ class AX18A:
 # ----------- COMMUNICATION METHODS -----------
 # ---------------------------------------------
 
-	def ping(self):
-		# Method to send the ping instruction to servo
-		# returns status packet received from servo
+	def get_status_expected(self, instruction, address=None, parameters=()):
+		# Method to check if the servo returns a status packet for instruction,
+		# based on the status return level in the local register
+		#	instruction:	String matching a key from the AX18A.instruction dictionary
+		#	address:		start address of write_data, the status return level
+		#	parameters:		being written is used if the write includes it
+		# Returns True if a status packet is expected
+
+		if (self.id == AX18A.broadcasting_id):
+			return False
+
+		level_address = AX18A.level_address
+		if (address != None and address <= level_address < address+len(parameters)):
+			level = parameters[level_address-address]
+		else:
+			self.hydrate(level_address)
+			level = self.register[level_address]
+
+		# Level 0: ping only, 1: ping and read data, 2: all instructions
+		if (instruction == 'ping' or level >= 2):
+			return True
+		return (level == 1 and instruction == 'read_data')
+
+	def transaction(self, instruction, parameters, nParams, status, reply_id=None):
+		# Method to send an instruction packet and read the status packet,
+		# trying again in case of communication error as decided by
+		# AX18A.retry_policy
+		#	instruction:	String matching a key from the AX18A.instruction dictionary
+		#	parameters:		instruction parameters
+		#	nParams:		number of parameters expected in the status packet
+		#	status:			True if a status packet is returned
+		#	reply_id:		ID of the status packet, if not the instance ID (a
+		#					write to the ID register is answered with the new ID)
+		# Returns status packet, or 0 if no status packet is returned
+		# Raises CircuitOpenError without sending if the servo has stopped
+		# responding (see RetryPolicy)
+		# Unread input is dropped when a transaction fails, so a late reply
+		# is not taken as the reply to the next instruction
+
+		if (reply_id == None):
+			reply_id = self.id
+
+		policy = AX18A.retry_policy
+		if (status):
+			max_attempts = policy.get_attempts(self.id)
+			if (max_attempts == 0):
+				AX18A.flush_input()
+				raise AX18A.CircuitOpenError(self.id, "transaction: servo not responding, circuit open")
+		else:
+			max_attempts = policy.attempts
+
+		# Assemble instruction packet
+		out_data = self.get_instruction_packet(instruction, parameters)
+
+		stats = AX18A.stats
+		if (stats != None):
+			start_time = time.perf_counter()
 
-		# Try three times in case of communication error
 		attempts = 0
-		while (attempts < 3):
+		while (True):
 			try:
-				# Set direction pin to TX and flush all serial input
+				# Set direction pin to TX and write instruction packet
 				AX18A.set_direction(AX18A.GPIO_direction_TX)
-				AX18A.port.flushInput()
-
-				# Assemble instruction packet
-				out_data = self.get_instruction_packet('ping', ())
-
-				# Write instruction packet
 				AX18A.port.write(out_data)
 				AX18A.set_direction(AX18A.GPIO_direction_RX) # Set direction pin back to RX
 
 				# Read status packet
-				status_packet = AX18A.get_status_packet()
+				if (status):
+					status_packet = AX18A.get_status_packet(reply_id, nParams, self.get_timeout(nParams))
+					policy.record_success(self.id)
+				else:
+					status_packet = 0
+
+				if (stats != None):
+					rx_bytes = len(status_packet) if status else 0
+					stats.record(instruction, self.id, time.perf_counter()-start_time, len(out_data)*(attempts+1), rx_bytes, attempts)
 				return status_packet
-			except (AX18A.CommError) as err:
+			except (AX18A.CommError, AX18A.ServoError) as err:
+				if (stats != None):
+					stats.record_error(instruction, self.id, err)
 				attempts += 1
-				if (attempts >= 3):
-					err.args = (self.id, err.args[1])
+				# Drop any partial or late reply
+				AX18A.flush_input()
+				if (attempts >= max_attempts or not policy.should_retry(err, attempts)):
+					if (status):
+						policy.record_failure(self.id, err)
+					err.args = (self.id,) + err.args[1:]
 					raise err
-				# Wait a set time before next attempt
-				AX18A.wait(AX18A.retry_delay)
+				# Wait before next attempt
+				AX18A.wait(policy.get_delay(attempts))
 
+	@bus_transaction(Bus.configuration)
+	def ping(self):
+		# Method to send the ping instruction to servo
+		# returns status packet received from servo
 
+		return self.transaction('ping', (), 0, True)
 
-	def read_data(self, address, length):
+	@bus_transaction(Bus.telemetry)
+	def read_data(self, address, length, use_cache=True):
 		# Method to send the read data instruction to servo
+		# Updates the register list with the values read
 		# 	address: 	register start address for reading
 		# 	length: 	is number of register addresses to read from
+		#	use_cache:	if True, cached values are returned without
+		#				communicating with the servo, see AX18A.cache_max_age
 		# Returns parameters read. If only one parameter read, value
 		# is returned in stead of tuple
 
-		# Try three times in case of communication error
-		attempts = 0
-		while (attempts < 3):
-			try:
-				# Set direction pin to TX and flush all serial input
-				AX18A.set_direction(AX18A.GPIO_direction_TX)
-				AX18A.port.flushInput()
+		# Serve from register cache if values can be trusted
+		if (self.id != AX18A.broadcasting_id):
+			if (use_cache and self.is_cached(address, length)):
+				AX18A.cache_stats['read_hits'] += 1
+				if (length == 1):
+					return self.register[address]
+				else:
+					return bytes(self.register[address:(address+length)])
+			AX18A.cache_stats['read_misses'] += 1
 
-				# Assemble instruction packet
-				out_data = self.get_instruction_packet('read_data', (address, length))
+		status_packet = self.transaction('read_data', (address, length), length, True)
 
-				# Write instruction packet
-				AX18A.port.write(out_data)
+		# Extract parameters from status_packet
+		parameters = AX18A.get_parameters_from_status_packet(status_packet)
+		if (self.id != AX18A.broadcasting_id and len(parameters) == length):
+			self.store_register(address, parameters)
 
-				# Read status packet
-				status_packet = AX18A.get_status_packet()
-				# Extract parameters from status_packet
-				parameters = AX18A.get_parameters_from_status_packet(status_packet)
+		# If only one parameter read, return that value
+		if (length == 1):
+			return parameters[0]
+		else:
+			return parameters
 
-				# If only one parameter read, return that value, otherwise return tuple
-				if (length == 1):
-					return parameters[0]
-				else:
-					return parameters
-			except (AX18A.CommError) as err:
-				attempts += 1
-				if (attempts >= 3):
-					err.args = (self.id, err.args[1])
-					raise err
-				# Wait a set time before next attempt
-				AX18A.wait(AX18A.retry_delay)
+	def read_block(self, address, length):
+		# Method to read a contiguous block of registers in one transaction
+		# and update the local register list
+		# 	address: 	register start address for reading
+		# 	length: 	number of register addresses to read
+		# Returns the values read (bytes), also when only one value is read
 
-	def write_data(self, address, *parameters):
-		# Method to send write data instruction to servo
-		# Updated the register list if successfull write
-		# 	address: 	register start address for writing
-		# 	parameters:	is a list of all values to be written
-		# return status packet received
+		if (address < 0 or length < 1 or address+length > 50):
+			raise AX18A.ParameterError(self.id, "read_block: block must be within register addresses 0-49")
 
-		# Try three times in case of communication error
-		attempts = 0
-		while (attempts < 3):
-			try:
-				# Set direction pin to TX and flush all serial input
-				AX18A.set_direction(AX18A.GPIO_direction_TX)
-				AX18A.port.flushInput()
+		# read_data updates the local register
+		if (length == 1):
+			return bytes((self.read_data(address, 1),))
+		else:
+			return self.read_data(address, length)
 
-				nParams = len(parameters)
+	@staticmethod
+	def get_pipeline_schedule(servos, length):
+		# Method to work out when each servo replies if read data instructions
+		# for all servos are sent back to back, from the return delay times
+		#	servos:	AX18A objects in the order instructions are sent
+		#	length:	number of registers read from each servo
+		# Returns list of (reply start, reply end) in seconds after the first
+		# byte is sent, or None if a reply would start while the bus is busy
+
+		instruction_time = 8*AX18A.byte_time	# Read data packet is 8 bytes
+		reply_time = (length+6)*AX18A.byte_time
+		bus_free = len(servos)*instruction_time + AX18A.pipeline_guard
+
+		schedule = []
+		for i, servo in enumerate(servos):
+			start = (i+1)*instruction_time + servo.get_return_delay_time()*1e-6
+			if (start < bus_free):
+				return None
+			schedule.append((start, start+reply_time))
+			bus_free = start + reply_time + AX18A.pipeline_guard
+
+		return schedule
 
-				# Assemble instruction packet
-				parameters_full = (address,) + tuple(parameters)
-				out_data = self.get_instruction_packet('write_data', parameters_full)
+	@staticmethod
+	def stagger_return_delays(servos, length):
+		# Method to program return delay times so read data instructions for
+		# servos can be sent back to back without the replies colliding.
+		# Servos are split into groups whose replies fit within the longest
+		# return delay time (508 us). Note that this makes single reads of
+		# the servos slower, since they wait longer before replying
+		#	servos:	AX18A objects in the order they will be read
+		#	length:	number of registers that will be read from each servo
+		# Returns list of group sizes
+
+		instruction_time = 8*AX18A.byte_time
+		reply_time = (length+6)*AX18A.byte_time
+
+		groups = []
+		i = 0
+		while (i < len(servos)):
+			# Find the largest group starting at servo i that fits
+			best = None
+			for size in range(1, len(servos)-i+1):
+				delays = []
+				bus_free = size*instruction_time + AX18A.pipeline_guard
+				for position in range(size):
+					received = (position+1)*instruction_time
+					value = max(0, int(-(-(bus_free - received)//2e-6)))	# Round up to 2 us steps
+					delays.append(value)
+					bus_free = received + value*2e-6 + reply_time + AX18A.pipeline_guard
+				if (max(delays) > 254):
+					break
+				best = delays
+
+			for position, value in enumerate(best):
+				servos[i+position].write_data(AX18A.address['return_delay_time'], value)
+			groups.append(len(best))
+			i += len(best)
+
+		return groups
 
-				# Write instruction packet
+	@staticmethod
+	@bus_transaction(Bus.telemetry)
+	def read_pipelined(servos, address, length):
+		# Method to read the same registers from several servos, sending the
+		# read data instructions back to back when the return delay times
+		# allow it (see stagger_return_delays), and taking the replies from
+		# the receive stream by ID. Servos that cannot be pipelined, or whose
+		# reply is missing or garbled, are read one at a time with read_data
+		#	servos:		AX18A objects
+		#	address: 	register start address for reading
+		# 	length: 	number of registers to read
+		# Returns dictionary of values read (bytes) with servo IDs as keys
+
+		blocks = {}
+		i = 0
+		while (i < len(servos)):
+			# Find the largest group starting at servo i with no collisions
+			size = 1
+			schedule = None
+			while (i+size < len(servos)):
+				next_schedule = AX18A.get_pipeline_schedule(servos[i:i+size+1], length)
+				if (next_schedule == None):
+					break
+				schedule = next_schedule
+				size += 1
+			group = servos[i:i+size]
+			i += size
+
+			if (size > 1):
+				# Send all instructions with a single write
+				out_data = bytearray()
+				for servo in group:
+					out_data += servo.get_instruction_packet('read_data', (address, length))
+				stats = AX18A.stats
+				if (stats != None):
+					start_time = time.perf_counter()
+				AX18A.set_direction(AX18A.GPIO_direction_TX)
 				AX18A.port.write(out_data)
 
-				# Read status packet if not broadcast ID
-				if (self.id != AX18A.broadcasting_id):
-					status_packet = AX18A.get_status_packet()
-					# Update register values if status packet returned
-					self.register[address:(address+nParams)] = parameters
-				else:
-					status_packet = 0
+				# Each reply gets until its scheduled end, plus latency margin
+				margin = max(AX18A.min_timeout, max(servo.latency or 0.0 for servo in group)*AX18A.timeout_factor)
+				previous_end = 0.0
+				try:
+					for start, end in schedule:
+						status_packet = AX18A.get_status_packet(None, length, end - previous_end + margin)
+						previous_end = end
+						parameters = AX18A.get_parameters_from_status_packet(status_packet)
+						ID = status_packet[2]
+						for servo in group:
+							if (servo.id == ID and len(parameters) == length):
+								servo.store_register(address, parameters)
+								blocks[ID] = bytes(parameters)
+								if (stats != None):
+									stats.record('read_data', ID, time.perf_counter()-start_time, len(out_data)//len(group), len(status_packet))
+				except (AX18A.CommError, AX18A.ServoError) as err:
+					# Collision or missing reply, drop the rest of the stream
+					if (stats != None):
+						stats.record_error('read_data', AX18A.broadcasting_id, err)
+					AX18A.flush_input()
+
+			# Read one at a time what was not received
+			for servo in group:
+				if (not servo.id in blocks):
+					blocks[servo.id] = servo.read_data(address, length, use_cache=False) if length > 1 else bytes((servo.read_data(address, 1, use_cache=False),))
+
+		return blocks
+
+	@bus_transaction(write_priority)
+	def write_data(self, address, *parameters):
+		# Method to send write data instruction to servo
+		# Updated the register list if successfull write
+		# 	address: 	register start address for writing
+		# 	parameters:	is a list of all values to be written
+		# return status packet received, 0 if none
 
-				return status_packet
-			except (AX18A.CommError) as err:
-				attempts += 1
-				if (attempts >= 3):
-					err.args = (self.id, err.args[1])
-					raise err
-				# Wait a set time before next attempt
-				AX18A.wait(AX18A.retry_delay)
+		# Skip write if the servo already has the values
+		if (self.id != AX18A.broadcasting_id and AX18A.cache_enabled and self.is_unchanged(address, parameters)):
+			return 0
 
+		return self.write_registers('write_data', address, parameters)
+
+	@bus_transaction(Bus.motion)
 	def reg_write(self, address, *parameters):
 		# Method to send reg_write instruction to servo
 		# Updated the register list if successfull write
 		# 	address: 	register start address for writing
 		# 	parameters:	is a list of all values to be written
-		# return status packet received
+		# return status packet received, 0 if none
 
-		# Try three times in case of communication error
-		attempts = 0
-		while (attempts < 3):
-			try:
-				# Set direction pin to TX and flush all serial input
-				AX18A.set_direction(AX18A.GPIO_direction_TX)
-				AX18A.port.flushInput()
+		return self.write_registers('reg_write', address, parameters)
 
-				nParams = len(parameters)
+	def write_registers(self, instruction, address, parameters):
+		# Method doing the transaction of write_data and reg_write, and
+		# keeping the register lists up to date
 
-				# Assemble instruction packet
-				parameters_full = (address,) + tuple(parameters)
-				out_data = self.get_instruction_packet('reg_write', parameters_full)
+		# Values are unknown until the write is confirmed (or sent, if the
+		# servo does not return a status packet for writes)
+		if (self.id != AX18A.broadcasting_id):
+			self.invalidate_register(address, len(parameters))
 
-				# Write instruction packet
-				AX18A.port.write(out_data)
-				AX18A.set_direction(AX18A.GPIO_direction_RX) # Set direction pin back to RX
+		# A write to the ID register is answered with the new ID
+		reply_id = None
+		id_address = AX18A.address['id']
+		if (instruction == 'write_data' and address <= id_address < address+len(parameters)):
+			reply_id = parameters[id_address-address]
 
-				# Read status packet if not broadcast ID
-				if (self.id != AX18A.broadcasting_id):
-					status_packet = AX18A.get_status_packet()
-					# Update register values if status packet returned
-					self.register[address:(address+nParams)] = parameters
-				else:
-					status_packet = 0
+		status = self.get_status_expected(instruction, address, parameters)
+		status_packet = self.transaction(instruction, (address,) + tuple(parameters), 0, status, reply_id)
 
-				return status_packet
-			except (AX18A.CommError) as err:
-				attempts += 1
-				if (attempts >= 3):
-					err.args = (self.id, err.args[1])
-					raise err
+		if (reply_id != None and self.id != AX18A.broadcasting_id):
+			self.id = reply_id
+
+		if (self.id == AX18A.broadcasting_id):
+			servos = list(AX18A.instances) 	# Written to all servos
+		else:
+			servos = [self]
+		for servo in servos:
+			if (instruction == 'reg_write'):
+				# Registered values only take effect on action
+				servo.registered_write = (address, tuple(parameters))
+			else:
+				servo.store_register(address, parameters, written=True)
 
+		return status_packet
+
+	@bus_transaction(Bus.motion)
 	def action(self):
 		# Method to send action instruction to servo.
 		# This method is only recommended to be used when
 		# instance ID is broadcasting ID
-		# returns status packet received
-
-		# Try three times in case of communication error
-		attempts = 0
-		while (attempts < 3):
-			try:
-				# Set direction pin to TX and flush all serial input
-				AX18A.set_direction(AX18A.GPIO_direction_TX)
-				AX18A.port.flushInput()
+		# Updates the register lists with the values of earlier reg_writes
+		# returns status packet received, 0 if none
 
-				# Assemble instruction packet
-				out_data = self.get_instruction_packet('action', ())
+		status_packet = self.transaction('action', (), 0, self.get_status_expected('action'))
 
-				# Write instruction packet
-				AX18A.port.write(out_data)
-				AX18A.set_direction(AX18A.GPIO_direction_RX) # Set direction pin back to RX
-
-				# Read status packet if not broadcast ID
-				if (self.id != AX18A.broadcasting_id):
-					status_packet = AX18A.get_status_packet()
-				else:
-					status_packet = 0
+		if (self.id == AX18A.broadcasting_id):
+			servos = list(AX18A.instances)
+		else:
+			servos = [self]
+		for servo in servos:
+			if (servo.registered_write != None):
+				(address, values) = servo.registered_write
+				servo.registered_write = None
+				servo.store_register(address, values, written=True)
 
-				return status_packet
-			except (AX18A.CommError) as err:
-				attempts += 1
-				if (attempts >= 3):
-					err.args = (self.id, err.args[1])
-					raise err
+		return status_packet
 
+	@bus_transaction(Bus.configuration)
 	def reset(self):
 		# Method to send the reset instruction to servo
-		# returns status packet received
+		# returns status packet received, 0 if none
 
-		# Try three times in case of communication error
-		attempts = 0
-		while (attempts < 3):
-			try:
-				# Set direction pin to TX and flush all serial input
-				AX18A.set_direction(AX18A.GPIO_direction_TX)
-				AX18A.port.flushInput()
+		status_packet = self.transaction('reset', (), 0, self.get_status_expected('reset'))
 
-				# Assemble instruction packet
-				out_data = self.get_instruction_packet('reset', ())
-
-				# Write instruction packet
-				AX18A.port.write(out_data)
-				AX18A.set_direction(AX18A.GPIO_direction_RX) # Set direction pin back to RX
+		# Set ID to 1 after reset, all register values are unknown
+		if (self.id == AX18A.broadcasting_id):
+			servos = list(AX18A.instances)
+		else:
+			servos = [self]
+		for servo in servos:
+			servo.id = 0x01
+			servo.invalidate_register(0, 50)
 
-				# Read status packet
-				status_packet = AX18A.get_status_packet()
-				
-				# Set ID to 1 after reset
-				self.id = 0x01
-
-				return status_packet
-			except (AX18A.CommError) as err:
-				attempts += 1
-				if (attempts >= 3):
-					err.args = (self.id, err.args[1])
-					raise err
+		return status_packet
 
+	@bus_transaction(Bus.motion)
 	def sync_write(self, servos, address, *args):
-		# Method to send the sync_write command.
+		# Method to send the sync_write command, writing to several servos
+		# with a single instruction packet.
 		# Only allowed if instance ID is broadcasting ID
 		# 	servos: 	a tuple of the AX18A objects representing each servo
 		#	address: 	starting address for writing
 		#	*args: 		a set of paramaters where each parameter is a tupple
 		#				containing the values to be written
+		# Updates the register list of each servo.
 		# Nothing is returned, since broadcasting ID is used
-		# TESTING HAS SHOWN SYNC_WRITE NOT TO WORK, DESPITE MENTIONED IN DOCUMENTATION
 
 		# Check that broadcasting ID is being used
 		if (self.id != AX18A.broadcasting_id):
 			raise AX18A.ParameterError(self.id, "sync_write: instance ID must be broadcasting ID (0xFE)")
 
-		# Check that servos length adds up with *args length
-		nServos = len(servos)
-		if (nServos != len(args)):
-			raise AX18A.ParameterError(self.id, "sync_write: number of servos not equal to number of write tuples")
+		nParams = AX18A.check_sync_write(servos, address, args)
 
-		# Get number of parameters from number of variables in first arg tuple
-		nParams = len(args[0])
+		# Leave out servos that already have the values
+		if (AX18A.cache_enabled):
+			changed = [i for i in range(len(servos)) if not servos[i].is_unchanged(address, args[i])]
+			if (len(changed) == 0):
+				return
+			servos = [servos[i] for i in changed]
+			args = [args[i] for i in changed]
 
-		# Assemble parameters list
+		# Assemble parameters list, ID of each servo followed by its values
 		parameters = [address, nParams] # Initial parameters
-		# Add parameters for each servo
-		for i, servo in enumerate(args):
-			# Check that all tuples are same length
-			if (len(servo) != nParams):
-				raise AX18A.ParameterError(self.id, "sync_write: all servos must have the same amount of data to write")
-			# Add ID of servo to parameters
-			parameters.append(servos[i].ID)
-			# Add each parameters for servo
-			for data in servo:
-				parameters.append(data)
+		for servo, values in zip(servos, args):
+			parameters.append(servo.id)
+			parameters.extend(values)
 
 		# Assemble instruction packet
 		out_data = self.get_instruction_packet('sync_write', parameters)
 
-		# Write instruction packet
+		# Set direction pin to TX and write instruction packet
+		stats = AX18A.stats
+		if (stats != None):
+			start_time = time.perf_counter()
+		AX18A.set_direction(AX18A.GPIO_direction_TX)
 		AX18A.port.write(out_data)
 		AX18A.set_direction(AX18A.GPIO_direction_RX) # Set direction pin back to RX
+		if (stats != None):
+			stats.record('sync_write', self.id, time.perf_counter()-start_time, len(out_data))
+
+		# No status packet is returned, update register values of each servo
+		for i, servo in enumerate(servos):
+			servo.store_register(address, args[i], written=True)
+
+	@staticmethod
+	def check_sync_write(servos, address, args):
+		# Method to check the servos and values of a sync_write, also used
+		# by Async_Dynamixel.AsyncBus
+		#	servos:		objects with the servo ID in id
+		#	args:		tuple of values for each servo
+		# Returns number of values per servo
+		# Raises ParameterError if the sync_write is not valid
+
+		ID = AX18A.broadcasting_id
+
+		# Check that servos length adds up with *args length
+		nServos = len(servos)
+		if (nServos == 0):
+			raise AX18A.ParameterError(ID, "sync_write: no servos to write to")
+		if (nServos != len(args)):
+			raise AX18A.ParameterError(ID, "sync_write: number of servos not equal to number of write tuples")
+
+		# Get number of parameters from number of variables in first arg tuple
+		nParams = len(args[0])
+		if (nParams == 0):
+			raise AX18A.ParameterError(ID, "sync_write: no data to write")
+		if (address < 0 or address+nParams > 50):
+			raise AX18A.ParameterError(ID, "sync_write: data does not fit in register")
+
+		# Packet length byte (parameters + 2) must fit in one byte
+		if ((nParams+1)*nServos + 4 > 0xFF):
+			raise AX18A.ParameterError(ID, "sync_write: too much data for one instruction packet")
+
+		ids = set()
+		for i, servo in enumerate(servos):
+			# Check that all tuples are same length
+			if (len(args[i]) != nParams):
+				raise AX18A.ParameterError(ID, "sync_write: all servos must have the same amount of data to write")
+			# Check that each servo is only written once and not broadcasting
+			if (servo.id in ids or servo.id == ID):
+				raise AX18A.ParameterError(ID, "sync_write: servo IDs must be unique and not broadcasting ID")
+			ids.add(servo.id)
+
+		return nParams
 
 # ---------------------------------------------
 # ---------------- SET METHODS ----------------
@@ -628,32 +1319,35 @@ class AX18A:
 		#	speed: 	rpm number from 0 to 113.5, can use AX18A.slow, medium or fast
 		#	method:	normal or reg; decides if write_data or reg_write is used
 
-		# Check angle parameter
-		if (angle < 30 or angle > 330):
-			raise AX18A.ParameterError(self.id, "move: angle must be between 30 and 330")
+		move_parameters = self.get_move_parameters(angle, speed)
 
-		# Check that speed value is in range
-		if (speed < 0 or speed > 113.5):
-			raise AX18A.ParameterError(self.id, "move: speed number must be between 0 and 113.5")
+		# Write using either write_data or reg_write instruction
+		if (method == "reg"):
+			self.reg_write(AX18A.goal_address, *move_parameters)
+		else:
+			self.write_data(AX18A.goal_address, *move_parameters)
 
-		# Get servo equivalent value
-		speed_value = int(speed/0.111)
+	def get_move_parameters(self, angle, speed=medium):
+		# Method to get the goal position and moving speed register values
+		# for a move command, see encode_move
+		return AX18A.encode_move(self.id, angle, speed)
 
-		# Get lowest and highest byte of angle value
-		dynamixel_angle = angle-30
-		angle_value = int(dynamixel_angle*3.41)
-		angle_l = angle_value & 0xFF
-		angle_h = angle_value >> 8
+	@staticmethod
+	def encode_move(ID, angle, speed=medium):
+		# Method to get the goal position and moving speed register values
+		# for a move command
+		#	ID:		servo ID, used in error messages
+		#	angle: 	numeric value from 30 to 330 degrees (servo angle limits)
+		#	speed: 	rpm number from 0 to 113.5, can use AX18A.slow, medium or fast
+		# Returns tuple (angle_l, angle_h, speed_l, speed_h)
 
-		# Get lowest and highest byte of speed value
-		speed_l = speed_value & 0xFF
-		speed_h = speed_value >> 8
+		try:
+			angle_value = AX18A.encode_goal_position(angle)
+			speed_value = AX18A.encode_moving_speed(speed)
+		except ValueError as err:
+			raise AX18A.ParameterError(ID, "move: " + err.args[0])
 
-		# Write using either write_data or reg_write instruction
-		if (method == "reg"):
-			self.reg_write(AX18A.address['goal_position_l'], angle_l, angle_h, speed_l, speed_h)
-		else:
-			self.write_data(AX18A.address['goal_position_l'], angle_l, angle_h, speed_l, speed_h)
+		return (angle_value & 0xFF, angle_value >> 8, speed_value & 0xFF, speed_value >> 8)
 
 	def set_angle_limit(self, angle_limit, direction):
 		# Method to set angle limit of servo
@@ -661,55 +1355,46 @@ class AX18A:
 		#					(servo angle limits)
 		#	direction:		AX18A.CW or AX18A.CCW
 
-		# Check angle parameter
-		if (angle_limit < 30 or angle_limit > 330):
-			raise AX18A.ParameterError(self.id, "set_angle_limit: angle_limit must be between 30 and 330")
-
-		# Get lowest and highest byte of angle_limit value
-		dynamixel_angle = angle_limit-30
-		angle_value = int(dynamixel_angle*3.41)
-		angle_l = angle_value & 0xFF
-		angle_h = angle_value >> 8
-
-		# Get register address from direction
 		if (direction == AX18A.CW):
-			address = AX18A.address['cw_angle_limit_l']
+			self.write_cw_angle_limit(angle_limit)
 		elif (direction == AX18A.CCW):
-			address = AX18A.address['ccw_angle_limit_l']
+			self.write_ccw_angle_limit(angle_limit)
 		else:
 			raise AX18A.ParameterError(self.id, "set_angle_limit: direction must be either AX18A.CW or AX18A.CCW")
 
-		# Write angle limit
-		self.write_data(address, angle_l, angle_h)
-
 	def set_id(self, new_id):
 		# Method to set the ID of the servo, also changes id of instance
-		#	new_id:	new servo ID
-
-		# Check id parameter
-		if (new_id<0 or new_id>252):
-			raise AX18A.ParameterError(self.id, "set_id: new_id must be in range 0-252")
+		#	new_id:	new servo ID (0-252)
 
 		# Write id to servo register
-		self.write_data(AX18A.address['id'], new_id)
+		self.write_id(new_id)
 		# Change instance id
 		self.id = new_id
 
+	def set_status_return_level(self, level):
+		# Method to set which instructions the servo returns a status packet for
+		# (EEPROM area). With level 1 writes are sent without waiting for a
+		# status packet, while reads still get one
+		#	level:	1 (only ping and read data) or 2 (all instructions)
+		# Level 0 is not allowed since read data would never be answered
+
+		if (not level in (1, 2)):
+			raise AX18A.ParameterError(self.id, "set_status_return_level: level must be 1 or 2")
+
+		self.write_status_return_level(level)
+
+	def set_return_delay_time(self, delay):
+		# Method to set the time the servo waits before sending a status packet
+		# (EEPROM area)
+		#	delay:	return delay time in microseconds, 0-508 in steps of 2
+
+		self.write_return_delay_time(delay)
+
 	def set_max_torque(self, max_torque):
 		# Method to set the Max Torque of the servo (EEPROM area)
 		#	max_torque:	percentage value for max torque 0-100%
 
-		# Check max_torque parameter
-		if (max_torque < 0 or max_torque > 100):
-			raise AX18A.ParameterError(self.id, "set_max_torque: max_torque must be in range 0-100")
-
-		# Get lowest and highest byte of torque value
-		torque_value = int(max_torque*10.23)
-		torque_l = torque_value & 0xFF
-		torque_h = torque_value >> 8
-
-		# Write to servo max torque registers
-		self.write_data(AX18A.address['max_torque_l'], torque_l, torque_h)
+		self.write_max_torque(max_torque)
 
 	def set_alarm(self, alarm, *args):
 		# Method to set which error the LED or shutdown should be activated for
@@ -717,19 +1402,13 @@ class AX18A:
 		#	*args: 	either a single 8-bit number between 0 and 127 representing the error bits
 		#			or strings representing each error
 
-		# Get number of parameters
-		nParams = len(args)
-
 		# Check that parameters have been given
-		if (nParams == 0):
-			raise AX18A.ParameterError(self.id, )
+		if (len(args) == 0):
+			raise AX18A.ParameterError(self.id, "set_alarm: no errors given")
 
 		# Check if number given as parameter
 		if (isinstance(args[0], int)):
 			alarm_value = args[0]
-			# Check correct input
-			if (not alarm_value in range(0, 128)):
-				raise AX18A.ParameterError(self.id, "set_alarm: error value must be in range 0-127")
 		else:
 			alarm_value = 0
 			# Loop through each given error and assemble alarm value
@@ -741,11 +1420,9 @@ class AX18A:
 				raise AX18A.ParameterError(self.id, "set_alarm: at least one error name was incorrect")
 
 		if (alarm == "led" or alarm == "LED"):
-			# Write value to register
-			self.write_data(AX18A.address['alarm_led'], alarm_value)
+			self.write_alarm_led(alarm_value)
 		elif (alarm == "shutdown" or alarm == "SHUTDOWN"):
-			# Write value to register
-			self.write_data(AX18A.address['alarm_shutdown'], alarm_value)
+			self.write_alarm_shutdown(alarm_value)
 		else:
 			raise AX18A.ParameterError(self.id, "set_alarm: alarm must be either led or shutdown")
 
@@ -754,28 +1431,13 @@ class AX18A:
 		# torque to stay in place
 		# 	torque_enable:	boolean true or false
 
-		# Set value to write (1 for enable 0 for disable)
-		if (torque_enable):
-			write_value = 1
-		else:
-			write_value = 0
-
-		# Write to register
-		self.write_data(AX18A.address['torque_enable'], write_value)
+		self.write_torque_enable(1 if torque_enable else 0)
 
 	def set_led(self, led):
 		# Method to turn led on or off
 		#	led: boolean true or false
 
-		# Set value to write (1 for on 0 for off)
-		if (led):
-			write_value = 1
-		else:
-			write_value = 0
-
-		# Write to register
-		self.write_data(AX18A.address['led'], write_value)
-			
+		self.write_led(1 if led else 0)
 
 	def set_compliance(self, margin, slope, direction):
 		# Method to set compliance margin and slope for selected direction
@@ -783,44 +1445,29 @@ class AX18A:
 		#	slope: 		value in range 1-7 representing slope level (see documentation)
 		#	direction:	AX18A.CW or AX18A.CCW
 
-		# Check parameters
-		if (margin < 0 or margin > 73):
-			raise AX18A.ParameterError(self.id, "set_compliance: margin must be in range 0-73")
-
-		if (not slope in range(1,8)):
-			raise AX18A.ParameterError(self.id, "set_compliance: slope must be in range 1-7")
+		# Check parameters before writing any of them
+		try:
+			AX18A.encode_cw_compliance_margin(margin)
+			AX18A.encode_cw_compliance_slope(slope)
+		except ValueError as err:
+			raise AX18A.ParameterError(self.id, "set_compliance: " + err.args[0])
 
-		# Calculate register values
-		margin_value = int(margin/0.29)
-		slope_value = 2**slope
-			
 		# Write to registers corresponding to selected direction
 		if (direction == AX18A.CW):
-			self.write_data(AX18A.address['cw_compliance_margin'], margin_value)
-			self.write_data(AX18A.address['cw_compliance_slope'], slope_value)
+			self.write_cw_compliance_margin(margin)
+			self.write_cw_compliance_slope(slope)
 		elif (direction == AX18A.CCW):
-			self.write_data(AX18A.address['ccw_compliance_margin'], margin_value)
-			self.write_data(AX18A.address['ccw_compliance_slope'], slope_value)
+			self.write_ccw_compliance_margin(margin)
+			self.write_ccw_compliance_slope(slope)
 		else:
 			raise AX18A.ParameterError(self.id, "set_compliance: direction must be AX18A.CW or AX18A.CCW")
 
-
 	def set_torque_limit(self, torque_limit):
 		# Method to set the servo Torque Limit (RAM area)
 		# if servo shuts itself down this must be set to turn it back on
 		#	torque_limit:	percentage value for torque limit 0-100%
 
-		# Check torque_limit parameter
-		if (torque_limit < 0 or torque_limit > 100):
-			raise AX18A.ParameterError(self.id, "set_torque_limit: torque_limit must be in range 0-100")
-
-		# Get lowest and highest byte of torque value
-		torque_value = int(torque_limit*10.23)
-		torque_l = torque_value & 0xFF
-		torque_h = torque_value >> 8
-
-		# Write to servo max torque registers
-		self.write_data(AX18A.address['torque_limit_l'], torque_l, torque_h)
+		self.write_torque_limit(torque_limit)
 
 	def set_punch(self, punch):
 		# Method to set servo punch (minimum current to drive motor)
@@ -828,290 +1475,500 @@ class AX18A:
 		# and parameter is therefore simply the register value
 		#	punch:	value between 0x03FF and 0x0000
 
-		if (not punch in range(0x0000, 0x0400)):
-			raise AX18A.ParameterError(self.id, "set_punch: punch must be in range 0x0000-0x03FF")
-
-		# Get lowest and highest byte of punch
-		punch_l = punch & 0xFF
-		punch_h = punch >> 8
-
-		# Write to servo punch registers
-		self.write_data(AX18A.address['punch_l'], punch_l, punch_h)
+		self.write_punch(punch)
 
 # ---------------------------------------------
 # ---------------- GET METHODS ----------------
 # ---------------------------------------------
 
+	# Each register in Control_Table.control_table has a read_<name> method,
+	# and writable registers a write_<name> method, see add_register_methods.
+	# Values of EEPROM and RAM settings are taken from the local register
+	# (read from the servo on first use), other values are read from the servo
+
 	def get_angle_limit(self, direction):
 		# Method to get the angle limit in degrees for the selected direction
-		# Does not communicate with servo, since local register values for
-		# EEPROM should always be correct
 		#	direction:	AX18A.CW or AX18A.CCW
 
-		# Get lowest and highest byte from register
 		if (direction == AX18A.CW):
-			angle_l = self.register[AX18A.address['cw_angle_limit_l']]
-			angle_h = self.register[AX18A.address['cw_angle_limit_h']]
+			return self.read_cw_angle_limit()
 		elif (direction == AX18A.CCW):
-			angle_l = self.register[AX18A.address['ccw_angle_limit_l']]
-			angle_h = self.register[AX18A.address['ccw_angle_limit_h']]
+			return self.read_ccw_angle_limit()
 		else:
 			raise AX18A.ParameterError(self.id, "get_angle_limit: direction must be either AX18A.CW or AX18A.CCW")
 
-		angle_full = angle_h << 8 | angle_l 	# Assemble 16bit variable (10bit max)
-		dynamixel_angle = angle_full/3.41		# Get angle as described in Dynamixel documentation
-		angle_limit = dynamixel_angle + 30		# Convert to angle that makes more sense
+	def get_return_delay_time(self):
+		# Method to get return delay time in microseconds
+		return self.read_return_delay_time()
 
-		return angle_limit
-
-	def get_max_torque(self):
-		# Method to get max torque in percentage value
-		# Does not communicate with servo, since local register values
-		# for EEPROM should always be correct
+	def get_timeout(self, nParams):
+		# Method to get the read timeout for a status packet from this servo
+		#	nParams: number of parameters in the status packet
+		# Uses the measured latency if calibrated, otherwise the default timeout
+		# The return delay time is taken from the local register without
+		# reading it, as reading needs a timeout too
 
-		# Get lowest and highest byte from register
-		torque_l = self.register[AX18A.address['max_torque_l']]
-		torque_h = self.register[AX18A.address['max_torque_h']]
+		if (self.latency == None):
+			return AX18A.default_timeout
 
-		torque_full = torque_h << 8 | torque_l 	# Assemble 16bit variable (10bit max)
-		max_torque = torque_full/10.23 			# Convert to percentage value
+		return_delay = self.register[AX18A.address['return_delay_time']]*2e-6
+		reply_time = return_delay + (nParams+6)*AX18A.byte_time
+		return max(AX18A.min_timeout, reply_time + self.latency*AX18A.timeout_factor)
 
-		return max_torque
+	def get_max_torque(self):
+		# Method to get max torque in percentage value
+		return self.read_max_torque()
 
 	def get_alarm(self, alarm):
 		# Method to get alarm led value
 		# first value returned is the register value, consecutive values
 		# are the names of each error.
-		# Des not communicate with servo, since local register values
-		# should be correct at all times
 		#	alarm:	led or shutdown
 
 		# Get register value for correct alarm
 		if (alarm == "led" or alarm == "LED"):
-			error_value = self.register[AX18A.address['alarm_led']]
+			error_value = self.read_alarm_led()
 		elif (alarm == "shutdown" or alarm == "SHUTDOWN"):
-			error_value = self.register[AX18A.address['alarm_shutdown']]
+			error_value = self.read_alarm_shutdown()
 		else:
 			raise AX18A.ParameterError(self.id, "get_alarm: alarm must be either led or shutdown")
 
-		# Get error name tuple
-		error_tuple = AX18A.get_error_tuple(error_value)
+		return (error_value,) + AX18A.get_error_tuple(error_value)
 
-		return_tuple = (error_value,) + error_tuple
-		return return_tuple
+	def get_status_return_level(self):
+		# Method to get status return level
+		return self.read_status_return_level()
 
 	def get_torque_enable(self):
 		# Method to get torque_enable status
 		# Reads from servo as this value is dynamic
-
-		# Read from servo 
-		torque_enable = self.read_data(AX18A.address['torque_enable'], 1)
-
-		# Update local register
-		self.register[AX18A.address['torque_enable']] = torque_enable
-
-		return torque_enable
+		return self.read_torque_enable()
 
 	def get_compliance(self, direction):
 		# Method to get compliance slope and margin
-		# Does not communicate with servo, since local register values
-		# should be correct at all times
 		#	direction: 	AX18A.CW or AX18A.CCW
+		# Returns tuple (margin in degrees, slope level)
 
-		# Get register values
 		if (direction == AX18A.CW):
-			margin_value = self.register[AX18A.address['cw_compliance_margin']]
-			slope_value = self.register[AX18A.address['cw_compliance_slope']]
+			return (self.read_cw_compliance_margin(), self.read_cw_compliance_slope())
 		elif (direction == AX18A.CCW):
-			margin_value = self.register[AX18A.address['ccw_compliance_margin']]
-			slope_value = self.register[AX18A.address['ccw_compliance_slope']]
+			return (self.read_ccw_compliance_margin(), self.read_ccw_compliance_slope())
 		else:
 			raise AX18A.ParameterError(self.id, "get_compliance: direction must be either AX18A.CW or AX18A.CCW")
 
-		# Convert to values of correct unit
-		margin = margin_value*0.29
-		slope = 1
-		slope_value = slope_value>>1
-		while(slope_value > 1):
-			slope_value = slope_value>>1
-			slope+=1
-
-		return (margin, slope)
-
 	def get_torque_limit(self):
 		# Method to get torque limit from servo
 		# This is dynamic according to the datasheet and will therefore
 		# communicate with servo. (Not sure if the datasheet is actually correct though)
 		# Torque limit is returned as a percentage value in range 0-100
-
-		# Read from servo
-		(torque_l, torque_h) = self.read_data(AX18A.address['torque_limit_l'], 2)
-
-		# Assemble full value
-		torque_value = torque_h << 8
-		torque_value = torque_value | torque_l
-
-		# Update local register
-		self.register[AX18A.address['torque_limit_l']] = torque_l
-		self.register[AX18A.address['torque_limit_h']] = torque_h
-
-		# Calculate percentage value
-		percentage_value = torque_value / 10.23
-		
-		return percentage_value
+		return self.read_torque_limit()
 
 	def get_position(self, time="current"):
 		# Method to get present or goal position of servo in degrees (30-330 degrees)
-		# Reads from servo and updates local register
 		#	time: 	current or goal, representing which position value to get
 		# Returns position in degrees
 
 		if (time == "current"):
-			register_address_l = AX18A.address['present_position_l']
-			register_address_h = AX18A.address['present_position_h']
+			return self.read_present_position()
 		elif (time == "goal"):
-			register_address_l = AX18A.address['goal_position_l']
-			register_address_h = AX18A.address['goal_position_h']
+			return self.read_goal_position()
 		else:
 			raise AX18A.ParameterError(self.id, "get_position: time must be either current or goal")
 
-		# Read from servo
-		(position_l, position_h) = self.read_data(register_address_l, 2)
-
-		# Assemble full value
-		position_value = position_h << 8
-		position_value = position_value | position_l
-
-		# Update local register
-		self.register[register_address_l] = position_l
-		self.register[register_address_h] = position_h
-
-		# Calculate angle value
-		dynamixel_angle = position_value/3.41
-		angle = dynamixel_angle+30
-
-		return angle
-
 	def get_speed(self):
 		# Method to get present speed from servo in rpm (0-113.5 rpm)
-		# Reads from servo and updates local register
-		# Returns speed in rpm
+		return self.read_present_speed()
 
-		# Read from servo
-		(speed_l, speed_h) = self.read_data(AX18A.address['present_speed_l'], 2)
+	def get_load(self):
+		# Method to get present load from servo in percent of max load
+		# Returns positive values for CW and negative for CCW
+		return self.read_present_load()
 
-		# Assemble full value
-		speed_value = speed_h << 8
-		speed_value = speed_value | speed_l
+	def get_volt(self):
+		# Method to get present voltage from servo in volts
+		return self.read_present_voltage()
 
-		# Update local register
-		self.register[AX18A.address['present_speed_l']] = speed_l
-		self.register[AX18A.address['present_speed_h']] = speed_h
+	def get_temperature(self):
+		# Method to get present temperature from servo (in degrees C)
+		return self.read_present_temperature()
 
-		# Calculate rpm value
-		rpm = speed_value*0.111
+	def get_registered(self):
+		# Method to check if servo has waiting reg_write command
+		# Returns True if command waiting, False otherwise
+		return bool(self.read_registered())
 
-		return rpm
+	def get_moving(self):
+		# Method to check if servo is moving
+		# Returns True if moving, False if not
+		return bool(self.read_moving())
 
-	def get_load(self):
-		# Method to get present load from servo in percent of max load
-		# Reads from servo and updates local register
-		# Returns positive values for CW and negative for CCW
+	def get_punch(self):
+		# Method to get punch value from servo register
+		# Due to lack of documentation this is just the value store in register
+		return self.read_punch()
 
-		# Read from servo
-		(load_l, load_h) = self.read_data(AX18A.address['present_load_l'], 2)
+	def read_registers(self, *names, use_cache=True):
+		# Method to read several registers with as few read data
+		# instructions as possible, see AX18A.get_read_plan
+		#	names:		register names from Control_Table.control_table
+		#	use_cache:	see read_data
+		# Returns dictionary of converted values with names as keys
 
-		# Assemble full value
-		load_value = load_h << 8
-		load_value = load_value | load_l
+		values = {}
+		for address, length, members in AX18A.get_read_plan(names):
+			block = self.read_data(address, length, use_cache)
+			AX18A.decode_registers(block if length > 1 else (block,), address, members, values)
+		return values
 
-		# Update local register
-		self.register[AX18A.address['present_load_l']] = load_l
-		self.register[AX18A.address['present_load_h']] = load_h
+	@staticmethod
+	def read_registers_pipelined(servos, *names):
+		# Method to read the same registers from several servos, using
+		# read_pipelined for each block of the read plan
+		#	servos:	AX18A objects
+		#	names:	register names from Control_Table.control_table
+		# Returns dictionary with servo IDs as keys of dictionaries of
+		# converted values with names as keys
+
+		values = {servo.id: {} for servo in servos}
+		for address, length, members in AX18A.get_read_plan(names):
+			for ID, block in AX18A.read_pipelined(servos, address, length).items():
+				AX18A.decode_registers(block, address, members, values[ID])
+		return values
 
-		# Calculate percentage value
-		load = (load_value&0x3FF)/10.23
-		# Set correct sign (by multiplying with -1 if direction bit is 0)
-		load = load*(-1+2*(load_value>>10))
+	@staticmethod
+	def get_read_plan(names):
+		# Method to get the blocks of registers read together for names,
+		# kept in AX18A.read_plans
+		# Returns tuple of (address, length, registers) blocks
 
-		return load
+		plan = AX18A.read_plans.get(names)
+		if (plan == None):
+			try:
+				registers = [AX18A.registers[name] for name in names]
+			except KeyError as err:
+				raise AX18A.ParameterError(AX18A.broadcasting_id, "get_read_plan: no register named " + str(err.args[0]))
+			plan = Control_Table.get_read_plan(registers, AX18A.read_plan_gap)
+			AX18A.read_plans[names] = plan
+		return plan
 
-	def get_volt(self):
-		# Method to get present voltage from servo
+	@staticmethod
+	def decode_registers(block, address, registers, values):
+		# Method to convert register values read from address to the units
+		# of registers, adding them to the values dictionary
+		for register in registers:
+			i = register.address - address
+			raw = block[i] if register.width == 1 else block[i+1] << 8 | block[i]
+			values[register.name] = AX18A.decoders[register.name](raw)
+
+	def get_state(self):
+		# Method to get present position, speed, load, voltage and temperature
+		# with a single read of the present state registers (0x24-0x2B)
 		# Reads from servo and updates local register
-		# Returns present voltage in volts
+		# Returns AX18A.State with values in the same units as get_position,
+		# get_speed, get_load, get_volt and get_temperature
 
-		# Read from servo
-		volt_value = self.read_data(AX18A.address['present_voltage'], 1)
+		block = self.read_block(AX18A.state_address, AX18A.state_length)
+		return AX18A.decode_state(block)
 
-		# Update local register
-		self.register[AX18A.address['present_voltage']] = volt_value
+	@staticmethod
+	def decode_state(block):
+		# Method to convert the present state registers to an AX18A.State
+		#	block: the 8 register values from address 0x24
 
-		# Calculate voltage value
-		volt = volt_value/10
+		(position_value, speed_value, load_value, voltage, temperature) = AX18A.state_struct.unpack_from(block)
 
-		return volt
+		return AX18A.State(
+			AX18A.value_to_angle(position_value),
+			speed_value*0.111,
+			AX18A.value_to_load(load_value),
+			voltage/10,
+			temperature
+		)
 
-	def get_temperature(self):
-		# Method to get present temperature from servo (in degrees C)
-		# Reads from servo and updates local register
-		# Returns temperature in degrees C
+	@staticmethod
+	def value_to_angle(position_value):
+		# Method to convert a position register value to degrees (30-330 degrees)
+		dynamixel_angle = position_value/3.41
+		return dynamixel_angle+30
 
-		# Read from servo 
-		temperature = self.read_data(AX18A.address['present_temperature'], 1)
+	@staticmethod
+	def value_to_load(load_value):
+		# Method to convert a load register value to percent of max load
+		# Positive values for CW and negative for CCW
+		load = (load_value&0x3FF)/10.23
+		return load*(-1+2*(load_value>>10))
 
-		# Update local register
-		self.register[AX18A.address['present_temperature']] = temperature
+# ---------------------------------------------
+# ---------- AUTOMATED FUNCTIONALITY ----------
+# ---------------------------------------------
 
-		# Register value is exactly the same as actual value
-		return int(temperature)
+	@bus_transaction(Bus.configuration)
+	def ping_once(self, timeout):
+		# Method to send a single ping with no retries, like probe
+		#	timeout:	read timeout in seconds
+		# Returns round trip time in seconds, or None if no valid reply
 
-	def get_registered(self):
-		# Method to check if servo has waiting reg_write command
-		# Reads from servo and updates local register
-		# Returns True if command waiting, False otherwise
+		out_data = self.get_instruction_packet('ping', ())
+		start_time = time.perf_counter()
+		try:
+			AX18A.set_direction(AX18A.GPIO_direction_TX)
+			AX18A.port.write(out_data)
+			AX18A.get_status_packet(self.id, 0, timeout)
+		except AX18A.ServoError:
+			pass 		# Error bits set, but the reply timing is valid
+		except AX18A.CommError:
+			AX18A.flush_input()
+			return None
+
+		return time.perf_counter()-start_time
+
+	def measure_latency(self, samples=10, max_failures=0):
+		# Method to measure round trip time of ping instructions
+		# Each ping is tried once, failed pings are left out of the timing
+		#	samples:		number of pings
+		#	max_failures:	number of failed pings allowed
+		# Returns tuple (min, mean, max) in seconds
+		# Raises TimeoutError if more than max_failures pings fail
+
+		timeout = self.get_timeout(0)
+		round_trips = []
+		for i in range(samples):
+			round_trip = self.ping_once(timeout)
+			if (round_trip != None):
+				round_trips.append(round_trip)
+
+		failures = samples - len(round_trips)
+		if (failures > max_failures or len(round_trips) == 0):
+			raise AX18A.TimeoutError(self.id, "measure_latency: %d of %d pings failed" % (failures, samples))
+
+		return (min(round_trips), sum(round_trips)/len(round_trips), max(round_trips))
+
+	def calibrate(self, samples=20):
+		# Method to find and program the smallest return delay time the servo
+		# can reliably be heard with, and measure the latency used for read
+		# timeouts of this servo
+		#	samples:	number of pings per tested return delay time
+		# Return delay times in AX18A.return_delay_steps are tried from large
+		# to small, the smallest one with no failed pings is kept, with
+		# AX18A.return_delay_margin added
+		# Returns tuple (return delay time in microseconds, latency in seconds)
+
+		# Use the default timeout while calibrating
+		self.latency = None
+		delay_address = AX18A.address['return_delay_time']
+		self.hydrate(delay_address)
+		original_value = self.register[delay_address]
+
+		best_value = None
+		for value in AX18A.return_delay_steps:
+			if (best_value != None and value >= best_value):
+				continue
+			try:
+				self.write_data(delay_address, value)
+				self.measure_latency(samples)
+			except (AX18A.CommError, AX18A.ServoError):
+				break
+			best_value = value
+
+		if (best_value == None):
+			best_value = original_value
+		else:
+			best_value = min(best_value + AX18A.return_delay_margin, 254)
 
-		# Read from servo
-		registered = self.read_data(AX18A.address['registered'], 1)
+		# Program the selected return delay time, the servo may not be heard
+		# with the last tested value so errors are retried a few times
+		AX18A.retry_policy.reset(self.id)
+		attempts = 0
+		while (True):
+			try:
+				self.write_data(delay_address, best_value)
+				break
+			except (AX18A.CommError, AX18A.ServoError):
+				attempts += 1
+				if (attempts >= 3):
+					raise
 
-		# Update local register
-		self.register[AX18A.address['registered']] = registered
+		# Latency is the measured round trip minus wire and return delay time,
+		# a few lost replies are left out rather than failing calibration
+		(_, _, max_round_trip) = self.measure_latency(samples, max_failures=samples//4)
+		wire_time = 12*AX18A.byte_time + best_value*2e-6
+		self.latency = max(max_round_trip - wire_time, 0.0)
 
-		return bool(registered)
+		return (best_value*2, self.latency)
 
-	def get_moving(self):
-		# Method to check if servo is moving
-		# Reads from servo and updates local register
-		# Returns True if moving, False if not
+	@staticmethod
+	@bus_transaction(Bus.configuration)
+	def probe(ID, timeout):
+		# Method to check if a servo responds, with a single read of model
+		# number and firmware version and no retries
+		#	ID:			servo ID to probe
+		#	timeout:	read timeout in seconds
+		# Returns tuple (model number, firmware version), or None if no reply.
+		# Model number and firmware are None if the servo replied with an error
+
+		out_data = AX18A.build_instruction_packet(ID, 'read_data', (AX18A.address['model_number_l'], 3))
+		try:
+			AX18A.set_direction(AX18A.GPIO_direction_TX)
+			AX18A.port.write(out_data)
+			status_packet = AX18A.get_status_packet(ID, 3, timeout)
+		except AX18A.ServoError:
+			return (None, None)
+		except AX18A.CommError:
+			AX18A.flush_input()
+			return None
+
+		parameters = AX18A.get_parameters_from_status_packet(status_packet)
+		return (parameters[1] << 8 | parameters[0], parameters[2])
 
-		# Read from servo
-		moving = self.read_data(AX18A.address['moving'], 1)
+	@staticmethod
+	def scan(ids=None, use_cache=True, cache_file=None):
+		# Method to find all servos on the bus
+		#	ids:		servo IDs to look for, all IDs (0-253) if None
+		#	use_cache:	if True and all IDs are scanned, the servos found by
+		#				the last full scan are probed first, and the full scan
+		#				is skipped if they all still respond
+		#	cache_file:	file the full scan result is saved to,
+		#				AX18A.scan_cache_file if None
+		# Each ID is probed once with a timeout just above the longest possible
+		# reply time (AX18A.scan_timeout), so a full scan takes well under a second.
+		# Returns dictionary of (model number, firmware version) with IDs as keys
 
-		# Update local register
-		self.register[AX18A.address['moving']] = moving
+		if (AX18A.port == None):
+			AX18A.set_transport(AX18A.default_transport)
+		if (cache_file == None):
+			cache_file = AX18A.scan_cache_file
 
-		return bool(moving)
+		full_scan = (ids == None)
+		if (full_scan):
+			ids = range(0, AX18A.broadcasting_id)
 
-	def get_punch(self):
-		# Method to get punch value from servo register
-		# Due to lack of documentation this is just the value store in register
-		# Does not communicate with servo, since local register value
-		# should be correct at all times
+		saved_timeout = AX18A.port.timeout
+		try:
+			# Check that all servos from last full scan still respond
+			if (full_scan and use_cache):
+				cached = AX18A.load_scan_cache(cache_file)
+				if (len(cached) > 0):
+					found = {}
+					for ID in cached:
+						info = AX18A.probe(ID, AX18A.scan_timeout)
+						if (info == None):
+							break
+						found[ID] = info
+					if (found == cached):
+						return found
+
+			found = {}
+			for ID in ids:
+				if (ID != AX18A.broadcasting_id):
+					info = AX18A.probe(ID, AX18A.scan_timeout)
+					if (info != None):
+						found[ID] = info
+		finally:
+			AX18A.port.timeout = saved_timeout
+
+		if (full_scan):
+			AX18A.save_scan_cache(cache_file, found)
+		return found
+
+	@staticmethod
+	def find_servos(ids):
+		# Method to check that servos are present before setting them up
+		#	ids:	servo IDs to look for
+		# IDs missing from a scan are read again with the normal timeout and
+		# retry policy, so one lost reply does not count as a missing servo
+		# Returns dictionary like scan
+
+		found = AX18A.scan(ids)
+		for ID in ids:
+			if (not ID in found):
+				try:
+					identity = AX18A(ID, check=False).read_data(AX18A.address['model_number_l'], 3, use_cache=False)
+				except AX18A.ServoError:
+					found[ID] = (None, None)
+				except AX18A.CommError:
+					continue
+				else:
+					found[ID] = (identity[1] << 8 | identity[0], identity[2])
+		return found
 
-		# Read from servo
-		(punch_l, punch_h) = self.read_data(AX18A.address['punch_l'], 2)
+	@staticmethod
+	def load_scan_cache(cache_file):
+		# Method to read the servos saved by scan
+		# Each line of the file is id:model number,firmware version
+		# Returns dictionary like scan, empty if file missing or corrupted
 
-		# Update local register
-		self.register[AX18A.address['punch_l']] = punch_l
-		self.register[AX18A.address['punch_l']] = punch_h
+		try:
+			f = open(cache_file, 'r')
+		except FileNotFoundError:
+			return {}
 
-		# Assemble full value
-		punch_value = punch_h << 8
-		punch_value = punch_value | punch_l
+		file_str = f.read()
+		f.close()
 
-		return punch_value
+		found = {}
+		try:
+			for line in file_str.splitlines():
+				ID, info = line.split(":")
+				model, firmware = info.split(",")
+				found[int(ID)] = (None if model == "None" else int(model), None if firmware == "None" else int(firmware))
+		except ValueError:
+			return {}
 
-# ---------------------------------------------
-# ---------- AUTOMATED FUNCTIONALITY ----------
-# ---------------------------------------------
+		return found
 
+	@staticmethod
+	def save_scan_cache(cache_file, found):
+		# Method to save the servos found by scan, see load_scan_cache
+
+		file_str = ""
+		for ID, (model, firmware) in sorted(found.items()):
+			file_str += "%d:%s,%s\n" % (ID, model, firmware)
+
+		f = open(cache_file, 'w')
+		f.write(file_str)
+		f.close()
+
+def add_register_methods(register):
+	# Function to add the read_<name>, write_<name> and encode_<name>
+	# methods of a register in the control table to the AX18A class
+	#	register:	Control_Table.Register
+
+	name = register.name
+	address = register.address
+	width = register.width
+	encode = Control_Table.get_encoder(register)
+	decode = Control_Table.get_decoder(register)
+	local = AX18A.register_class[address] != 'volatile'
+	word = AX18A.word
+
+	def read(self, use_cache=True):
+		# Settings are taken from the local register, other values read
+		if (use_cache and local):
+			self.hydrate(address, width)
+			if (width == 1):
+				return decode(self.register[address])
+			return decode(word.unpack_from(self.register, address)[0])
+		values = self.read_data(address, width, use_cache)
+		if (width == 1):
+			return decode(values)
+		return decode(word.unpack_from(values)[0])
+
+	def write(self, value):
+		try:
+			raw = encode(value)
+		except ValueError as err:
+			raise AX18A.ParameterError(self.id, "write_%s: %s" % (name, err.args[0]))
+		if (width == 1):
+			return self.write_data(address, raw)
+		return self.write_data(address, raw & 0xFF, raw >> 8)
+
+	read.__name__ = 'read_' + name
+	setattr(AX18A, read.__name__, read)
+	if ('w' in register.access):
+		write.__name__ = 'write_' + name
+		setattr(AX18A, write.__name__, write)
+		setattr(AX18A, 'encode_' + name, staticmethod(encode))
+	AX18A.decoders[name] = decode
+
+for register in Control_Table.control_table:
+	add_register_methods(register)
@@ -1,21 +1,23 @@
+import sys
 from Dynamixel import AX18A
 
-attempts = 0
-while (attempts < 4):
-	try:
-		grip = AX18A(2)
-		handRot = AX18A(3)
-		handL = AX18A(4)
-		handR = AX18A(5)
-		elbowL = AX18A(6)
-		elbowR = AX18A(7)
-		rot = AX18A(8)
-		brod = AX18A(AX18A.broadcast_ID)
-	except AX18A.AX18A_error:
-		attempts += 1
-		print("Initialization failed, trying again")
-	else:
-		attempts = 5
+# Find servos before setting them up
+servo_ids = (2, 3, 4, 5, 6, 7, 8)
+found = AX18A.find_servos(servo_ids)
+print("Servos found: ", sorted(found))
+missing = [ID for ID in servo_ids if not ID in found]
+if (len(missing) > 0):
+	sys.exit("Servos not found: " + str(missing))
+
+# find_servos has already checked they are present
+grip = AX18A(2, check=False)
+handRot = AX18A(3, check=False)
+handL = AX18A(4, check=False)
+handR = AX18A(5, check=False)
+elbowL = AX18A(6, check=False)
+elbowR = AX18A(7, check=False)
+rot = AX18A(8, check=False)
+brod = AX18A(AX18A.broadcasting_id)
 
 handRot.move(180, AX18A.fast, method="reg")
 
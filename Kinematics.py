@@ -0,0 +1,201 @@
+'''
+Kinematics.py
+Date:		17.10.26
+
+Forward kinematics of the arm. The rot joint turns the arm about the
+vertical axis, elbow and hand bend it in the vertical plane and hand_rot
+turns the gripper about the hand axis. Joint angles are those of
+Arm.get_joint_angle in degrees, all zero with the arm straight up.
+
+Coordinates (mm) are measured from the table below the rot axis:
+	x:	forward (rot angle 0)
+	y:	left (positive rot angle)
+	z:	up
+Rotation (degrees) of the gripper:
+	x_rot:	roll about the hand axis (hand_rot angle)
+	y_rot:	tilt of the hand axis from vertical, 90 is horizontal and
+			180 points down
+	z_rot:	heading about the vertical axis (rot angle)
+
+Link lengths are in links, change them to match the arm.
+
+Inverse kinematics is analytic: rot points the arm at the target (or away
+from it, reaching back over the top), and elbow and hand form a two link
+chain with the hand bent either way. Solver caches the solutions within
+joint_limits for recently used targets, and picks the one nearest to its
+previous solution.
+
+Example:
+	(position, rotation) = Kinematics.forward(0, 60, 90, 0)
+	positions = Kinematics.forward_batch(angles)['position']
+	solver = Kinematics.Solver()
+	(rot, elbow, hand, hand_rot) = solver.solve(250, 0, 80)
+'''
+
+import math
+from collections import OrderedDict
+
+# NumPy is only needed for forward_batch
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+links = {
+	'base': 100.0, 		# Table to elbow axis
+	'upper_arm': 220.0, 	# Elbow axis to hand axis
+	'hand': 160.0 		# Hand axis to grip point
+}
+
+# Joint angle range (degrees) of servo positions 30-330
+joint_limits = {
+	'rot': (-150, 150),
+	'elbow': (-150, 150),
+	'hand': (-150, 150)
+}
+
+def forward(rot, elbow, hand, hand_rot=0, links=links):
+	# Function to get the grip point and gripper rotation for joint angles
+	#	rot, elbow, hand, hand_rot:	joint angles in degrees
+	# Returns tuple of ((x, y, z), (x_rot, y_rot, z_rot))
+
+	rot_rad = math.radians(rot)
+	elbow_rad = math.radians(elbow)
+	tilt_rad = elbow_rad + math.radians(hand)
+
+	radius = links['upper_arm']*math.sin(elbow_rad) + links['hand']*math.sin(tilt_rad)
+	z = links['base'] + links['upper_arm']*math.cos(elbow_rad) + links['hand']*math.cos(tilt_rad)
+
+	return ((radius*math.cos(rot_rad), radius*math.sin(rot_rad), z), (hand_rot, elbow + hand, rot))
+
+def get_radius(elbow, hand, links=links):
+	# Function to get the horizontal distance from the rot axis to the grip
+	# point (mm), which does not depend on rot and hand_rot
+	return links['upper_arm']*math.sin(math.radians(elbow)) + links['hand']*math.sin(math.radians(elbow + hand))
+
+def forward_batch(angles, links=links):
+	# Function to evaluate forward kinematics for many joint configurations
+	#	angles:	array of shape (n, 4) or (n, 5) with columns in the order of
+	#			Arm.joints (rot, elbow, hand, hand_rot, grip), grip is ignored
+	# Returns dictionary of float arrays of shape (n, 3):
+	#	position:	(x, y, z) in mm
+	#	rotation:	(x_rot, y_rot, z_rot) in degrees
+
+	if (np is None):
+		raise RuntimeError("Kinematics: numpy is required")
+
+	angles = np.atleast_2d(np.asarray(angles, dtype=np.float64))
+	if (angles.shape[1] < 4):
+		raise ValueError("forward_batch: angles must have rot, elbow, hand and hand_rot columns")
+	rot = angles[:, 0]
+	elbow = angles[:, 1]
+	tilt = elbow + angles[:, 2]
+
+	rot_rad = np.radians(rot)
+	elbow_rad = np.radians(elbow)
+	tilt_rad = np.radians(tilt)
+	radius = links['upper_arm']*np.sin(elbow_rad) + links['hand']*np.sin(tilt_rad)
+
+	position = np.empty((len(angles), 3))
+	position[:, 0] = radius*np.cos(rot_rad)
+	position[:, 1] = radius*np.sin(rot_rad)
+	position[:, 2] = links['base'] + links['upper_arm']*np.cos(elbow_rad) + links['hand']*np.cos(tilt_rad)
+
+	rotation = np.empty((len(angles), 3))
+	rotation[:, 0] = angles[:, 3]
+	rotation[:, 1] = tilt
+	rotation[:, 2] = rot
+
+	return {'position': position, 'rotation': rotation}
+
+def inverse(x, y, z, hand_rot=0, links=links, limits=joint_limits):
+	# Function to get every joint configuration putting the grip point at
+	# (x, y, z) in mm
+	# Returns tuple of (rot, elbow, hand, hand_rot) tuples in degrees, empty
+	# if the point is out of reach or all solutions are outside limits
+
+	upper_arm = links['upper_arm']
+	hand = links['hand']
+	height = z - links['base']
+	reach = math.hypot(x, y)
+	heading = math.degrees(math.atan2(y, x)) if reach > 0 else 0.0
+
+	cos_hand = (reach*reach + height*height - upper_arm*upper_arm - hand*hand)/(2*upper_arm*hand)
+	if (cos_hand < -1 or cos_hand > 1):
+		return ()
+	hand_angle = math.acos(cos_hand)
+
+	solutions = []
+	# Facing the target, or facing away and reaching back over the top
+	for (rot, radius) in ((heading, reach), (heading - math.copysign(180, heading), -reach)):
+		for bend in (hand_angle, -hand_angle):
+			elbow = math.atan2(radius, height) - math.atan2(hand*math.sin(bend), upper_arm + hand*math.cos(bend))
+			elbow = (math.degrees(elbow) + 180) % 360 - 180
+			angles = (rot, elbow, math.degrees(bend))
+			if (all(low <= angle <= high for angle, (low, high) in zip(angles, (limits['rot'], limits['elbow'], limits['hand'])))):
+				solution = angles + (hand_rot,)
+				if (not solution in solutions):
+					solutions.append(solution)
+
+	return tuple(solutions)
+
+class Solver:
+	# Inverse kinematics with a cache of solutions for recent targets
+	#	resolution:	targets are rounded to multiples of resolution (mm)
+	#				before solving, and share a cache entry
+	#	cache_size:	number of targets kept in the cache
+
+	def __init__(self, resolution=0.5, cache_size=256, links=links, limits=joint_limits):
+		self.resolution = resolution
+		self.cache_size = cache_size
+		self.links = links
+		self.limits = limits
+		self.cache = OrderedDict() 	# Quantised target: solutions, least recently used first
+		self.hits = 0
+		self.misses = 0
+		self.previous = None 		# Last solution returned by solve
+
+	def get_solutions(self, x, y, z):
+		# Method to get all solutions for the quantised target, from the cache
+		# if possible
+		# Returns tuple of (rot, elbow, hand) tuples
+		resolution = self.resolution
+		key = (round(x/resolution), round(y/resolution), round(z/resolution))
+		solutions = self.cache.get(key)
+		if (solutions != None):
+			self.hits += 1
+			self.cache.move_to_end(key)
+			return solutions
+
+		self.misses += 1
+		solutions = tuple(solution[:3] for solution in inverse(key[0]*resolution, key[1]*resolution, key[2]*resolution, 0, self.links, self.limits))
+		self.cache[key] = solutions
+		if (len(self.cache) > self.cache_size):
+			self.cache.popitem(last=False)
+		return solutions
+
+	def solve(self, x, y, z, hand_rot=0, previous=None):
+		# Method to get the solution for (x, y, z) nearest to previous
+		#	previous:	(rot, elbow, hand, ...) angles to start from, the last
+		#				solution of this solver if None
+		# Returns (rot, elbow, hand, hand_rot) tuple, or None if out of reach
+
+		solutions = self.get_solutions(x, y, z)
+		if (len(solutions) == 0):
+			return None
+
+		if (previous == None):
+			previous = self.previous
+		if (previous == None):
+			solution = solutions[0]
+		else:
+			solution = min(solutions, key=lambda angles: sum((a - b)**2 for a, b in zip(angles, previous[:3])))
+
+		self.previous = solution + (hand_rot,)
+		return self.previous
+
+	def clear(self):
+		# Method to empty the cache, needed after changing links or limits
+		self.cache.clear()
+		self.hits = 0
+		self.misses = 0
@@ -0,0 +1,191 @@
+'''
+Pose_Store.py
+Date:		17.10.26
+
+Store of named arm poses, each a tuple of joint angles in the order of
+Arm.joints (rot, elbow, hand, hand_rot, grip). All poses are held in memory
+as floats. Changes are appended to a journal file, so saving a pose writes
+one record, and the journal is rewritten with one record per pose when it
+has grown to compact_ratio times the number of poses.
+
+Journal format, little endian:
+	magic		8 bytes, STORE_MAGIC
+	records		one for each change:
+		operation	1 byte, STORE_SET or STORE_DELETE
+		name length	1 byte
+		name		UTF-8 bytes
+		angles		5 doubles (zero for STORE_DELETE)
+		crc			4 bytes, CRC32 of the bytes above
+Loading stops at the first incomplete or damaged record, which is cut off
+before the next change is appended. A compacted journal is written to a
+temporary file and moved over the old one, so a crash leaves one of them
+complete.
+
+The text file of earlier versions (name:rot,elbow,hand,hand_rot,grip on
+each line) is read once if the journal does not exist yet.
+
+Example:
+	store = PoseStore("positions.bin", text_file="positions.txt")
+	store.save("pickup", (0, 60, 90, 0, 40))
+	angles = store["pickup"]
+'''
+
+import os
+import struct
+import zlib
+
+STORE_MAGIC = b"AXPOS\x00\x01\n"
+STORE_SET = 0
+STORE_DELETE = 1
+record_header = struct.Struct("<BB")
+angles_struct = struct.Struct("<5d")
+crc_struct = struct.Struct("<I")
+
+class PoseStore:
+	#	file:			path of journal file, created if missing
+	#	text_file:		path of text file to migrate, None to skip
+	#	compact_ratio:	journal records per pose that trigger compaction
+	#	compact_min:	journal records below which compaction is skipped
+
+	def __init__(self, file, text_file=None, compact_ratio=4, compact_min=64):
+		self.file = file
+		self.compact_ratio = compact_ratio
+		self.compact_min = compact_min
+		self.poses = {}
+		self.records = 0 		# Records in journal
+		self.end = None 		# Length of journal up to last valid record
+
+		if (os.path.exists(file)):
+			self.load()
+		else:
+			if (text_file != None):
+				self.poses = PoseStore.read_text_file(text_file)
+			self.compact()
+
+	@staticmethod
+	def pack_record(operation, name, angles):
+		name_bytes = name.encode('utf-8')
+		if (len(name_bytes) > 0xFF):
+			raise ValueError("PoseStore: name longer than 255 bytes")
+		record = record_header.pack(operation, len(name_bytes)) + name_bytes + angles_struct.pack(*angles)
+		return record + crc_struct.pack(zlib.crc32(record))
+
+	@staticmethod
+	def read_text_file(text_file):
+		# Method to read poses from a text file with name:angle,angle,... lines
+		# Lines that can not be read are skipped
+		# Returns dictionary of angle tuples with names as keys
+		try:
+			f = open(text_file, 'r')
+		except FileNotFoundError:
+			return {}
+		file_str = f.read()
+		f.close()
+
+		poses = {}
+		for line in file_str.splitlines():
+			try:
+				name, values = line.split(":")
+				angles = tuple(float(value) for value in values.split(","))
+			except ValueError:
+				print("PoseStore: skipping corrupted line in ", text_file)
+				continue
+			if (len(angles) == angles_struct.size//8):
+				poses[name] = angles
+			else:
+				print("PoseStore: skipping corrupted line in ", text_file)
+		return poses
+
+	def load(self):
+		# Method to read all records of the journal
+		f = open(self.file, 'rb')
+		data = f.read()
+		f.close()
+
+		if (data[0:len(STORE_MAGIC)] != STORE_MAGIC):
+			raise ValueError("PoseStore: %s is not a pose store" % self.file)
+
+		self.poses = {}
+		self.records = 0
+		offset = len(STORE_MAGIC)
+		while (offset + record_header.size <= len(data)):
+			(operation, name_length) = record_header.unpack_from(data, offset)
+			angles_offset = offset + record_header.size + name_length
+			end = angles_offset + angles_struct.size + crc_struct.size
+			if (end > len(data)):
+				break
+			(crc,) = crc_struct.unpack_from(data, end - crc_struct.size)
+			if (crc != zlib.crc32(data[offset:end - crc_struct.size])):
+				break
+
+			name = data[offset + record_header.size:angles_offset].decode('utf-8')
+			if (operation == STORE_SET):
+				self.poses[name] = angles_struct.unpack_from(data, angles_offset)
+			elif (operation == STORE_DELETE):
+				self.poses.pop(name, None)
+			self.records += 1
+			offset = end
+
+		self.end = offset
+
+	def append(self, record):
+		# Method to add a record to the journal and wait until it is on disk
+		f = open(self.file, 'r+b')
+		f.truncate(self.end) 		# Cut off any damaged record
+		f.seek(self.end)
+		f.write(record)
+		f.flush()
+		os.fsync(f.fileno())
+		f.close()
+
+		self.end += len(record)
+		self.records += 1
+		if (self.records >= self.compact_min and self.records > self.compact_ratio*len(self.poses)):
+			self.compact()
+
+	def compact(self):
+		# Method to rewrite the journal with one record for each pose
+		data = STORE_MAGIC + b"".join(PoseStore.pack_record(STORE_SET, name, angles) for name, angles in self.poses.items())
+
+		temp_file = self.file + ".tmp"
+		f = open(temp_file, 'wb')
+		f.write(data)
+		f.flush()
+		os.fsync(f.fileno())
+		f.close()
+		os.replace(temp_file, self.file)
+
+		self.records = len(self.poses)
+		self.end = len(data)
+
+	def save(self, name, angles):
+		# Method to add or replace a pose
+		#	angles:	5 angles in the order of Arm.joints
+		angles = tuple(float(angle) for angle in angles)
+		self.append(PoseStore.pack_record(STORE_SET, name, angles))
+		self.poses[name] = angles
+
+	def delete(self, name):
+		# Method to remove a pose, raises KeyError if not saved
+		if (not name in self.poses):
+			raise KeyError(name)
+		self.append(PoseStore.pack_record(STORE_DELETE, name, (0,)*5))
+		del self.poses[name]
+
+	def get(self, name, default=None):
+		return self.poses.get(name, default)
+
+	def names(self):
+		return list(self.poses)
+
+	def items(self):
+		return self.poses.items()
+
+	def __getitem__(self, name):
+		return self.poses[name]
+
+	def __contains__(self, name):
+		return name in self.poses
+
+	def __len__(self):
+		return len(self.poses)
@@ -0,0 +1,118 @@
+'''
+Retry_Policy.py
+Date:		17.10.26
+
+Retry policy for the AX18A class. Decides which failed transactions are
+tried again and how long to wait before the next attempt (exponential
+backoff with jitter), and keeps a circuit breaker for each servo ID. After
+breaker_threshold failed transactions in a row the breaker opens, and
+transactions with that servo fail at once for breaker_time seconds. Then
+a single attempt is let through, closing the breaker again if the servo
+replies.
+
+Example:
+	AX18A.retry_policy = RetryPolicy(attempts=2, base_delay=0.002)
+	AX18A.retry_policy.get_state(5)		# 'closed', 'open' or 'half_open'
+'''
+
+import time
+import random
+
+class RetryPolicy:
+	# Default decisions by exception class name, True to try again
+	default_retry_on = {
+		'TimeoutError': True,
+		'ChecksumError': True,
+		'StartSignalError': True,
+		'ServoError': False,
+		'CircuitOpenError': False
+	}
+	# Errors counted by the circuit breaker, other errors mean the servo is
+	# still responding
+	default_breaker_errors = ('TimeoutError',)
+
+	#	attempts:			max attempts for each transaction
+	#	base_delay:			wait before second attempt (seconds)
+	#	backoff:			factor the wait is multiplied by for each attempt
+	#	max_delay:			longest wait between attempts (seconds)
+	#	jitter:				part of the wait that is random (0-1)
+	#	retry_on:			dictionary of exception class names and decisions,
+	#						updates default_retry_on
+	#	breaker_threshold:	failed transactions in a row opening the breaker,
+	#						None to disable the circuit breaker
+	#	breaker_time:		time the breaker stays open (seconds)
+
+	def __init__(self, attempts=3, base_delay=0.01, backoff=2.0, max_delay=0.1, jitter=0.5,
+			retry_on=None, breaker_threshold=3, breaker_time=1.0):
+		self.attempts = attempts
+		self.base_delay = base_delay
+		self.backoff = backoff
+		self.max_delay = max_delay
+		self.jitter = jitter
+		self.retry_on = dict(RetryPolicy.default_retry_on)
+		if (retry_on != None):
+			self.retry_on.update(retry_on)
+		self.breaker_errors = set(RetryPolicy.default_breaker_errors)
+		self.breaker_threshold = breaker_threshold
+		self.breaker_time = breaker_time
+
+		self.failures = {} 		# Failed transactions in a row, IDs as keys
+		self.open_until = {} 	# Time the breaker of an ID lets an attempt through
+
+	def get_attempts(self, ID):
+		# Method to get the number of attempts allowed for a transaction
+		# Returns 0 if the breaker of ID is open, 1 if it is half open (the
+		# transaction tests if the servo is back), otherwise self.attempts
+
+		if (not ID in self.open_until):
+			return self.attempts
+		if (time.monotonic() < self.open_until[ID]):
+			return 0
+		return 1
+
+	def should_retry(self, err, attempt):
+		# Method to decide if a transaction is tried again
+		#	err:		exception raised by attempt
+		#	attempt:	number of attempts made so far
+		return self.retry_on.get(type(err).__name__, False)
+
+	def get_delay(self, attempt):
+		# Method to get the wait before the next attempt (seconds)
+		#	attempt:	number of attempts made so far (1 or more)
+		delay = min(self.max_delay, self.base_delay*self.backoff**(attempt-1))
+		return delay*(1 - self.jitter*random.random())
+
+	def record_success(self, ID):
+		# Method to close the breaker of ID after a successful transaction
+		if (ID in self.failures):
+			del self.failures[ID]
+			self.open_until.pop(ID, None)
+
+	def record_failure(self, ID, err):
+		# Method to count a failed transaction, opening the breaker of ID if
+		# the threshold is reached
+		if (self.breaker_threshold == None or not type(err).__name__ in self.breaker_errors):
+			self.record_success(ID)
+			return
+		failures = self.failures.get(ID, 0) + 1
+		self.failures[ID] = failures
+		if (failures >= self.breaker_threshold):
+			self.open_until[ID] = time.monotonic() + self.breaker_time
+
+	def get_state(self, ID):
+		# Method to get the breaker state of ID: closed, open or half_open
+		attempts = self.get_attempts(ID)
+		if (attempts == 0):
+			return 'open'
+		if (ID in self.open_until):
+			return 'half_open'
+		return 'closed'
+
+	def reset(self, ID=None):
+		# Method to close the breaker of ID, or of all IDs if None
+		if (ID == None):
+			self.failures.clear()
+			self.open_until.clear()
+		else:
+			self.failures.pop(ID, None)
+			self.open_until.pop(ID, None)
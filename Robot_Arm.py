@@ -1,5 +1,9 @@
 from Dynamixel import AX18A
+import Kinematics
+import Board_Table
+from Pose_Store import PoseStore
 import math
+import time
 
 class Arm:
 
@@ -13,90 +17,112 @@ class Arm:
 
 	joints = ('rot', 'elbow', 'hand', 'hand_rot', 'grip')
 
+	servo_ids = (grip_id, hand_rot_id, hand_l_id, hand_r_id, elbow_l_id, elbow_r_id, rot_id)
+
+	board_table_file = "board.bin"
+	positions_file = "positions.bin"
+	positions_text_file = "positions.txt" 	# Saved positions of earlier versions
+
 	def __init__(self):
 
-		# Setup servos
-		self.grip = AX18A(Arm.grip_id)
-		self.hand_rot = AX18A(Arm.hand_rot_id)
-		self.hand_l = AX18A(Arm.hand_l_id)
-		self.hand_r = AX18A(Arm.hand_r_id)
-		self.elbow_l = AX18A(Arm.elbow_l_id)
-		self.elbow_r = AX18A(Arm.elbow_r_id)
-		self.rot = AX18A(Arm.rot_id)
+		# Check that all servos respond before setting them up
+		found = AX18A.find_servos(Arm.servo_ids)
+		missing = [ID for ID in Arm.servo_ids if not ID in found]
+		if (len(missing) > 0):
+			raise AX18A.TimeoutError(missing[0], "Arm: servos not found: " + str(missing))
+
+		# Setup servos, find_servos has already checked they are present
+		self.grip = AX18A(Arm.grip_id, check=False)
+		self.hand_rot = AX18A(Arm.hand_rot_id, check=False)
+		self.hand_l = AX18A(Arm.hand_l_id, check=False)
+		self.hand_r = AX18A(Arm.hand_r_id, check=False)
+		self.elbow_l = AX18A(Arm.elbow_l_id, check=False)
+		self.elbow_r = AX18A(Arm.elbow_r_id, check=False)
+		self.rot = AX18A(Arm.rot_id, check=False)
 		self.brod = AX18A(AX18A.broadcasting_id) # Broadcasting id for sending action instruction
 
 		self.servos = (self.grip, self.hand_rot, self.hand_l, self.hand_r, self.elbow_l, self.elbow_r, self.rot)
+		self.servo_map = {servo.id: servo for servo in self.servos}
+		self.move_latency = None 	# Seconds taken to send the last move_all
+
+		# Use saved EEPROM values where model and firmware match the scan
+		for servo in self.servos:
+			servo.load_snapshot(*found[servo.id])
 
 		self.brod.set_compliance(0, 6, AX18A.CW)
 		self.brod.set_compliance(0, 6, AX18A.CCW)
 
 
-		self.position = self.get_position()
-		self.rotation = self.get_rotation()
+		states = self.get_states()
+		self.position = self.get_position(states)
+		self.rotation = self.get_rotation(states)
 
 		self.saved_positions = Arm.get_saved_positions()
+		self.solver = Kinematics.Solver()
+		self.board_table = self.load_board_table()
 
-	@staticmethod
-	def get_saved_positions():
+	def set_write_status(self, enabled):
+		# Sets whether servos return a status packet for writes.
+		# With status disabled writes are not confirmed, which halves the
+		# bus time for streaming goal positions. Reads are always answered
+		#	enabled: boolean true or false
+		# returns True if all servos were set
+
+		level = 2 if enabled else 1
 		try:
-			f = open("positions.txt", 'r')
-		except FileNotFoundError:
-			f = open("positions.txt", 'w')
-			f.close()
-			f = open("positions.txt", 'r')
+			for servo in self.servos:
+				servo.set_status_return_level(level)
+			return True
+		except AX18A.CommError as err:
+			print("Failed to communicate with servo: ", err.args[0], "Error message: ", err.args[1])
+		except AX18A.ServoError as err:
+			print("Servo ", err.args[0], " returned error: ", err.args[1])
 
-		file_str = f.read()
-		f.close()
+		return False
+
+	def calibrate(self, samples=20):
+		# Calibrates return delay time and read timeouts of every servo
+		# returns dictionary of (return delay time in us, latency in s) with
+		# servo ids as keys, or False if a servo failed
+
+		results = {}
+		try:
+			for servo in self.servos:
+				results[servo.id] = servo.calibrate(samples)
+		except AX18A.CommError as err:
+			print("Failed to communicate with servo: ", err.args[0], "Error message: ", err.args[1])
+			return False
+		except AX18A.ServoError as err:
+			print("Servo ", err.args[0], " returned error: ", err.args[1])
+			return False
 
-		str_lst = file_str.splitlines()
-		pos_dict = {}
-		for s in str_lst:
-			sk, sv = s.split(":")
-			pos_dict[sk] = sv
+		return results
 
-		return pos_dict
+	@staticmethod
+	def get_saved_positions():
+		# Returns Pose_Store.PoseStore of saved positions, positions.txt is
+		# read into a new store
+		return PoseStore(Arm.positions_file, text_file=Arm.positions_text_file)
 
 	def save_current_position(self, name):
-		# Adds the current positions to the saved positions dictionary with name as key
-		# The value of a position is a string with each angle value comma separated
+		# Adds the current positions to the saved positions with name as key
 		# The order of values is: rot, elbow, hand, hand rot, grip (not and angle)
-		# Finally saves the new dictionary to positions file
 
 		angles = self.get_all_angles()
-		pos_str = "%f,%f,%f,%f,%f" % (angles['rot'], angles['elbow'], angles['hand'], angles['hand_rot'], angles['grip'])
-		self.saved_positions[name] = pos_str
+		self.saved_positions.save(name, [angles[joint] for joint in Arm.joints])
 
-		all_pos_str = ""
-		for key, val in self.saved_positions.items():
-			all_pos_str += key + ":" + val + "\n"
-
-		f = open("positions.txt", 'w')
-		f.write(all_pos_str)
-		f.close
-
-	def move_to_position(self, position, *excluded):
-		# Move arm to position in saved position dictionary
+	def move_to_position(self, position, *excluded, method="sync"):
+		# Move arm to position in saved positions, all joints start together
 		# Can add joint strings after position parameter to exclude those joints
-		# Return True if success
+		#	method:	"sync" or "reg", see move_all
+		# Return True if success, time taken is in self.move_latency
 
 		try:
-			pos_str = self.saved_positions[position]
+			joint_angles = self.saved_positions[position]
 		except KeyError:
 			print("move_to_position: invalid position")
 			return False
 
-		try:
-			angle_str_lst = pos_str.split(",")
-			joint_angles = [float(angle_str) for angle_str in angle_str_lst]
-			rot_angle = float(angle_str_lst[0])
-			elbow_angle = float(angle_str_lst[1])
-			hand_angle = float(angle_str_lst[2])
-			hand_rot_angle = float(angle_str_lst[3])
-			grip_angle = float(angle_str_lst[4])
-		except:
-			print("move_to_position: corrupted positions file")
-			return False
-
 		ex_mask = 0
 		for joint in excluded:
 			try:
@@ -105,49 +131,51 @@ class Arm:
 			except ValueError:
 				print("move_to_position: invalid joint to exclude")
 
+		angles = {}
 		for i in range(0,5):
 			if (ex_mask & 2**i != 2**i):
-				self.move_joint(Arm.joints[i], joint_angles[i], speed=AX18A.slow)
+				angles[Arm.joints[i]] = joint_angles[i]
 			else:
 				print("move_to_position: excluding ", Arm.joints[i])
 
-		return True
-		#self.move_joint('rot', rot_angle, AX18A.slow)
-		#self.move_joint('elbow', elbow_angle, AX18A.slow)
-		#self.move_joint('hand', hand_angle, AX18A.slow)
-		#self.move_joint('hand_rot', hand_rot_angle, AX18A.slow)
-		#self.move_joint('grip', grip_angle, AX18A.slow)
+		return self.move_all(angles, speeds=AX18A.slow, method=method)
 
-	def move_joint(self, joint, angle, speed=AX18A.medium):
+	def get_servo_angles(self, joint, angle):
+		# Converts a joint angle into servo angles
 		# Joint is string with possible values:
 		#	rot, elbow, hand, hand_rot, grip
-		# returns True if successfull joint move
+		# Returns tuple of (servo, servo angle) pairs, or None if invalid joint
 
 		servo_angle_l = angle+180
 		servo_angle_r = 360 - servo_angle_l
 		if (joint == 'rot'):
-			servo_l = self.rot
-			servo_r = None
+			return ((self.rot, servo_angle_l),)
 		elif (joint == 'elbow'):
 			servo_angle_l = -angle+180
 			servo_angle_r = 360-servo_angle_l
-			servo_l = self.elbow_l
-			servo_r = self.elbow_r
+			return ((self.elbow_l, servo_angle_l), (self.elbow_r, servo_angle_r))
 		elif (joint == 'hand'):
-			servo_l = self.hand_l
-			servo_r = self.hand_r
+			return ((self.hand_l, servo_angle_l), (self.hand_r, servo_angle_r))
 		elif (joint == 'hand_rot'):
-			servo_l = self.hand_rot
-			servo_r = None
+			return ((self.hand_rot, servo_angle_l),)
 		elif (joint == 'grip'):
 			servo_angle_l = (angle/1.1)+252
-			servo_l = self.grip
-			servo_r = None
+			return ((self.grip, servo_angle_l),)
 		else:
+			return None
+
+	def move_joint(self, joint, angle, speed=AX18A.medium):
+		# Joint is string with possible values:
+		#	rot, elbow, hand, hand_rot, grip
+		# returns True if successfull joint move
+
+		servo_angles = self.get_servo_angles(joint, angle)
+		if (servo_angles == None):
 			print("move_joint: invalid joint input")
 			return False
 
-		if (servo_r == None):
+		if (len(servo_angles) == 1):
+			(servo_l, servo_angle_l), = servo_angles
 			try:
 				servo_l.move(servo_angle_l, speed)
 				return True
@@ -158,6 +186,7 @@ class Arm:
 			except AX18A.ServoError as err:
 				print("Servo ", err.args[0], " returned error: ", err.args[1])
 		else:
+			(servo_l, servo_angle_l), (servo_r, servo_angle_r) = servo_angles
 			try:
 				servo_l.move(servo_angle_l, speed, method="reg")
 				servo_r.move(servo_angle_r, speed, method="reg")
@@ -173,18 +202,169 @@ class Arm:
 		# If method has reached this point, servo has not successfully moved
 		return False
 
+	def move_all(self, angles, speeds=AX18A.medium, method="sync"):
+		# Moves several joints at once, so all servos start at the same time
+		#	angles:	dictionary of joint angles with joint strings as keys, or
+		#			sequence of angles in the order of Arm.joints
+		#	speeds:	single speed for all joints, dictionary with joint strings
+		#			as keys, or sequence in the order of Arm.joints
+		#	method:	"sync" for a single sync_write packet, "reg" for
+		#			reg_write to each servo and a single action
+		# Joints not in angles are not moved
+		# returns True if successfull move, the time from call until the
+		# move is sent is in self.move_latency (seconds)
+
+		start_time = time.perf_counter()
+		if (not method in ("sync", "reg")):
+			print("move_all: method must be sync or reg")
+			return False
+		if (not isinstance(angles, dict)):
+			angles = dict(zip(Arm.joints, angles))
+		if (isinstance(speeds, (int, float))):
+			speeds = {joint: speeds for joint in angles}
+		elif (not isinstance(speeds, dict)):
+			speeds = dict(zip(Arm.joints, speeds))
+
+		# Assemble goal position and speed values for each servo
+		servos = []
+		values = []
+		try:
+			for joint, angle in angles.items():
+				servo_angles = self.get_servo_angles(joint, angle)
+				if (servo_angles == None):
+					print("move_all: invalid joint input")
+					return False
+				for servo, servo_angle in servo_angles:
+					servos.append(servo)
+					values.append(servo.get_move_parameters(servo_angle, speeds[joint]))
+		except KeyError:
+			print("move_all: missing speed for joint")
+			return False
+		except AX18A.ParameterError:
+			print("move_all: invalid input")
+			return False
 
-	def get_position(self):
-		x = 0
-		y = 0
-		z = 0
-		return (x, y, z)
+		if (len(servos) == 0):
+			self.move_latency = time.perf_counter() - start_time
+			return True
 
-	def get_rotation(self):
-		x_rot = 0
-		y_rot = 0
-		z_rot = 0
-		return (x_rot, y_rot, z_rot)
+		try:
+			if (method == "sync"):
+				self.brod.sync_write(servos, AX18A.address['goal_position_l'], *values)
+			else:
+				for servo, servo_values in zip(servos, values):
+					servo.reg_write(AX18A.address['goal_position_l'], *servo_values)
+				self.brod.action()
+			self.move_latency = time.perf_counter() - start_time
+			return True
+		except AX18A.ParameterError:
+			print("move_all: invalid input")
+		except AX18A.CommError as err:
+			print("Failed to communicate with servo: ", err.args[0], "Error message: ", err.args[1])
+		except AX18A.ServoError as err:
+			print("Servo ", err.args[0], " returned error: ", err.args[1])
+
+		return False
+
+	def move_to_xyz(self, x, y, z, hand_rot=0, speed=AX18A.medium):
+		# Moves the grip point to (x, y, z) in mm, see Kinematics
+		# Of the joint solutions reaching the point, the one nearest to the
+		# previous move_to_xyz is used
+		#	hand_rot:	hand_rot joint angle in degrees
+		# returns True if successfull move
+
+		angles = self.solver.solve(x, y, z, hand_rot)
+		if (angles == None):
+			print("move_to_xyz: position out of reach")
+			return False
+
+		return self.move_all(dict(zip(Arm.joints, angles)), speed)
+
+	def load_board_table(self, file=None):
+		# Reads the board square table saved by build_board_table
+		# Returns Board_Table.BoardTable, or None if missing or built for
+		# other servos
+		if (file == None):
+			file = Arm.board_table_file
+
+		table = Board_Table.load(file)
+		if (table != None and not set(table.servo_ids) <= set(self.servo_map)):
+			print("load_board_table: table built for other servos")
+			return None
+		return table
+
+	def build_board_table(self, file=None):
+		# Computes the pose of every board square (see Board_Table) and saves
+		# the table. Run after changing Board_Table.board or Kinematics.links
+		# The gripper is turned with rot so it stays square to the board
+		# returns the table
+
+		if (file == None):
+			file = Arm.board_table_file
+
+		servos = [servo for joint in Arm.joints[0:4] for (servo, servo_angle) in self.get_servo_angles(joint, 0)]
+		solver = Kinematics.Solver(resolution=0.1)
+
+		def get_poses(x, y, z):
+			angles = solver.solve(x, y, z)
+			if (angles == None):
+				return None
+			angles = angles[0:3] + (angles[0],)
+
+			goals = []
+			for joint, angle in zip(Arm.joints, angles):
+				for servo, servo_angle in self.get_servo_angles(joint, angle):
+					try:
+						goals.append(AX18A.encode_goal_position(servo_angle))
+					except ValueError:
+						return None
+			return (angles, goals)
+
+		self.board_table = Board_Table.build([servo.id for servo in servos], get_poses)
+		Board_Table.save(self.board_table, file)
+		return self.board_table
+
+	def move_to_square(self, square, height='approach', speed=AX18A.medium):
+		# Moves the grip point to a board square using the board table, with
+		# a single sync_write
+		#	square:	(column, row) tuple or name like "e2", see Board_Table
+		#	height:	string in Board_Table.height_names
+		# returns True if successfull move
+
+		if (self.board_table == None):
+			print("move_to_square: board table not built")
+			return False
+		try:
+			goals = self.board_table.get_goals(square, height)
+			speed_value = AX18A.encode_moving_speed(speed)
+		except ValueError:
+			print("move_to_square: invalid input")
+			return False
+		if (goals == None):
+			print("move_to_square: square out of reach")
+			return False
+
+		servos = [self.servo_map[ID] for ID, goal in goals]
+		values = [(goal & 0xFF, goal >> 8, speed_value & 0xFF, speed_value >> 8) for ID, goal in goals]
+		try:
+			self.brod.sync_write(servos, AX18A.address['goal_position_l'], *values)
+			return True
+		except AX18A.CommError as err:
+			print("Failed to communicate with servo: ", err.args[0], "Error message: ", err.args[1])
+
+		return False
+
+	def get_position(self, states=None):
+		# Returns (x, y, z) of the grip point in mm, see Kinematics
+		#	states: optional dictionary from get_states, the servos are read if not given
+		angles = self.get_all_angles(states)
+		return Kinematics.forward(angles['rot'], angles['elbow'], angles['hand'], angles['hand_rot'])[0]
+
+	def get_rotation(self, states=None):
+		# Returns (x_rot, y_rot, z_rot) of the gripper in degrees, see Kinematics
+		#	states: optional dictionary from get_states, the servos are read if not given
+		angles = self.get_all_angles(states)
+		return Kinematics.forward(angles['rot'], angles['elbow'], angles['hand'], angles['hand_rot'])[1]
 
 	def rest(self):
 		try:
@@ -204,46 +384,99 @@ class Arm:
 		AX18A.wait(8) # Wait 8 seconds before turning torque off
 		self.brod.set_torque_enable(False)
 
-	def get_joint_angle(self, joint):
+	def get_joint_angle(self, joint, states=None):
 		# Returns joint angle, or displacement in case of grip.
 		# Returns false if invalid input
+		#	states: optional dictionary from get_states, the servo is read if not given
 		if (joint == 'rot'):
-			joint_angle = round(self.rot.get_position()-180, 2)
+			servo = self.rot
 		elif (joint == 'elbow'):
-			joint_angle = round(180-self.elbow_l.get_position(), 2)
+			servo = self.elbow_l
 		elif (joint == 'hand'):
-			joint_angle = round(self.hand_l.get_position()-180, 2)
+			servo = self.hand_l
 		elif (joint == 'hand_rot'):
-			joint_angle = round(self.hand_rot.get_position()-180, 2)
+			servo = self.hand_rot
 		elif (joint == 'grip'):
-			joint_angle = round(self.grip.get_position()-252, 2)*1.1
+			servo = self.grip
 		else:
 			print("get_joint_angle: invalid joint input")
 			return False
 
-		return joint_angle
+		if (states == None):
+			position = servo.get_position()
+		else:
+			position = states[servo.id].position
 
-	def get_all_angles(self):
-		rot_angle = self.get_joint_angle('rot')
-		hand_angle = self.get_joint_angle('hand')
-		elbow_angle = self.get_joint_angle('elbow')
-		hand_rot_angle = self.get_joint_angle('hand_rot')
-		grip_disp = self.get_joint_angle('grip')
+		return Arm.get_joint_angle_from_position(joint, position)
+
+	@staticmethod
+	def get_joint_angle_from_position(joint, position):
+		# Converts the servo position of a joint's primary servo to joint angle
+		if (joint == 'elbow'):
+			return round(180-position, 2)
+		elif (joint == 'grip'):
+			return round(position-252, 2)*1.1
+		else:
+			return round(position-180, 2)
+
+	def get_states(self, servos=None):
+		# Reads the present state block of each servo. Instructions are sent
+		# back to back where return delay times allow it (see
+		# stagger_return_delays), otherwise one transaction per servo
+		#	servos: servos to read, all servos if not given
+		# Returns dictionary of AX18A.State with servo ids as keys
+		if (servos == None):
+			servos = self.servos
+
+		blocks = AX18A.read_pipelined(servos, AX18A.state_address, AX18A.state_length)
+
+		states = {}
+		for servo in servos:
+			states[servo.id] = AX18A.decode_state(blocks[servo.id])
+
+		return states
+
+	def stagger_return_delays(self):
+		# Programs servo return delay times so get_states can pipeline reads
+		# returns list of group sizes, or False if a servo failed
+		try:
+			return AX18A.stagger_return_delays(self.servos, AX18A.state_length)
+		except AX18A.CommError as err:
+			print("Failed to communicate with servo: ", err.args[0], "Error message: ", err.args[1])
+		except AX18A.ServoError as err:
+			print("Servo ", err.args[0], " returned error: ", err.args[1])
+
+		return False
+
+	def get_all_angles(self, states=None):
+		#	states: optional dictionary from get_states, only the five
+		#			primary joint servos are read if not given
+		if (states == None):
+			states = self.get_states((self.rot, self.hand_l, self.elbow_l, self.hand_rot, self.grip))
+
+		angles_dict = {}
+		for joint in ("rot", "hand", "elbow", "hand_rot", "grip"):
+			angles_dict[joint] = self.get_joint_angle(joint, states)
 
-		angles_dict = {"rot":rot_angle, "hand":hand_angle, "elbow":elbow_angle, "hand_rot":hand_rot_angle, "grip":grip_disp}
 		return angles_dict
 
-	def get_temps(self):
+	def get_temps(self, states=None):
+		if (states == None):
+			states = self.get_states()
+
 		temps = {}
 		for servo in self.servos:
-			temps[servo.id] = servo.get_temperature()
+			temps[servo.id] = states[servo.id].temperature
 
 		return temps
 
-	def get_loads(self):
+	def get_loads(self, states=None):
+		if (states == None):
+			states = self.get_states()
+
 		loads = {}
 		for servo in self.servos:
-			loads[servo.id] = servo.get_load()
+			loads[servo.id] = states[servo.id].load
 
 		return loads
 
@@ -255,11 +488,22 @@ class Arm:
 			return False
 
 	def correct_pickup(self, distance):
-		radius = 277 # Should be changed to dynamic radius calculation
+		# Turns the arm so the grip point moves sideways by distance (mm)
+		# Radius is the horizontal reach of the current elbow and hand angles
+		states = self.get_states((self.elbow_l, self.hand_l))
+		radius = Kinematics.get_radius(self.get_joint_angle('elbow', states), self.get_joint_angle('hand', states))
+		if (radius == 0):
+			# Grip point is on the rot axis, turning does not move it
+			print("correct_pickup: grip point on rot axis")
+			return False
+		if (abs(distance) > abs(radius)):
+			print("correct_pickup: distance larger than radius")
+			return False
 		angle_rad = math.asin(distance/radius)
 		angle_deg = math.degrees(angle_rad)
 		self.move_joint('rot', angle_deg, AX18A.slow)
 		self.move_joint('hand_rot', angle_deg, AX18A.slow)
+		return True
 
 	def pickup(self):
 		if (self.move_to_position("pickup", 'rot', 'hand_rot')):
@@ -0,0 +1,211 @@
+'''
+Sim_Test.py
+Date:		17.10.26
+
+Test file run against the simulated bus, so no servos are needed. Checks
+the status packet framer, the register write cache, the pose store journal
+and inverse kinematics round trips
+'''
+
+import os
+import tempfile
+import Transport
+import Kinematics
+from Dynamixel import AX18A
+from Pose_Store import PoseStore
+
+class TestBus(Transport.SimulatedBus):
+	# Simulated bus counting instruction packets, that can delay or prefix
+	# the next reply
+	#	late:	if True, the next reply arrives after the driver timed out
+	#	noise:	bytes received before the next reply
+
+	def __init__(self, **kwargs):
+		Transport.SimulatedBus.__init__(self, realtime=False, **kwargs)
+		self.packets = 0
+		self.late = False
+		self.noise = b""
+		self.held = b""
+
+	def write(self, data):
+		self.packets += 1
+		written = Transport.SimulatedBus.write(self, data)
+		with self.lock:
+			if (self.late):
+				self.late = False
+				self.held = bytes(self.rx_buffer)
+				self.rx_buffer.clear()
+			if (len(self.noise) > 0):
+				self.rx_buffer[0:0] = self.noise
+				self.noise = b""
+		return written
+
+	def readinto(self, buffer):
+		received = Transport.SimulatedBus.readinto(self, buffer)
+		if (received == 0 and len(self.held) > 0):
+			# Reply arrives just after the read timed out
+			self.rx_buffer += self.held
+			self.held = b""
+		return received
+
+bus = TestBus()
+AX18A.set_transport(bus)
+AX18A.retry_policy.attempts = 1
+test = AX18A(3)
+
+print("-----01.01-----")
+# Read returns the values in the simulated control table
+if (test.read_data(AX18A.address['id'], 1, use_cache=False) == 3 and
+	test.read_data(AX18A.address['model_number_l'], 2, use_cache=False) == b"\x12\x00"):
+	print("01.01: passed")
+else:
+	print("01.01: failed")
+
+print("-----01.02-----")
+# Error byte in reply raises ServoError, writing present position is not allowed
+try:
+	test.transaction('write_data', (AX18A.address['present_position_l'], 0), 0, True)
+except AX18A.ServoError:
+	print("01.02: passed")
+else:
+	print("01.02: failed")
+
+print("-----01.03-----")
+# Reply arriving after the timeout is not taken as reply to the next read
+bus.late = True
+try:
+	test.read_data(AX18A.address['id'], 1, use_cache=False)
+except AX18A.TimeoutError:
+	pass
+if (test.read_data(AX18A.address['torque_enable'], 1, use_cache=False) == 0):
+	print("01.03: passed")
+else:
+	print("01.03: failed")
+
+print("-----01.04-----")
+# Noise before the start signal is skipped
+bus.noise = b"\x00\x13\xFF\x55"
+if (test.read_data(AX18A.address['id'], 1, use_cache=False) == 3):
+	print("01.04: passed")
+else:
+	print("01.04: failed")
+
+print("-----02.01-----")
+# Cached RAM value is read without communicating with the servo
+test.write_data(AX18A.address['cw_compliance_margin'], 2)
+packets = bus.packets
+if (test.read_data(AX18A.address['cw_compliance_margin'], 1) == 2 and bus.packets == packets):
+	print("02.01: passed")
+else:
+	print("02.01: failed")
+
+print("-----02.02-----")
+# Writing the cached value again is skipped
+AX18A.reset_cache_stats()
+test.write_data(AX18A.address['cw_compliance_margin'], 2)
+if (bus.packets == packets and AX18A.get_cache_stats()['write_hits'] == 1):
+	print("02.02: passed")
+else:
+	print("02.02: failed")
+
+print("-----02.03-----")
+# Volatile registers are always read from the servo
+test.read_data(AX18A.address['present_position_l'], 2)
+if (bus.packets == packets+1):
+	print("02.03: passed")
+else:
+	print("02.03: failed")
+
+print("-----02.04-----")
+# Registered values are only stored when action is sent
+test.reg_write(AX18A.address['ccw_compliance_margin'], 4)
+before_action = test.register[AX18A.address['ccw_compliance_margin']]
+AX18A(AX18A.broadcasting_id).action()
+if (before_action != 4 and
+	test.register[AX18A.address['ccw_compliance_margin']] == 4 and
+	bus.servos[3].register[AX18A.address['ccw_compliance_margin']] == 4):
+	print("02.04: passed")
+else:
+	print("02.04: failed")
+
+directory = tempfile.mkdtemp()
+journal = os.path.join(directory, "positions.bin")
+
+print("-----03.01-----")
+# Saved poses are read back from the journal
+store = PoseStore(journal)
+store.save("pickup", (0, 60, 90, 0, 40))
+store.save("home", (0, 0, 0, 0, 0))
+store.save("pickup", (10, 60, 90, 0, 40))
+store.delete("home")
+store = PoseStore(journal)
+if (store.names() == ["pickup"] and store["pickup"] == (10.0, 60.0, 90.0, 0.0, 40.0)):
+	print("03.01: passed")
+else:
+	print("03.01: failed")
+
+print("-----03.02-----")
+# Damaged last record is dropped, and cut off before the next save
+f = open(journal, 'ab')
+f.write(PoseStore.pack_record(0, "broken", (1, 2, 3, 4, 5))[:-3])
+f.close()
+store = PoseStore(journal)
+store.save("drop", (0, 30, 30, 0, 0))
+store = PoseStore(journal)
+if (sorted(store.names()) == ["drop", "pickup"]):
+	print("03.02: passed")
+else:
+	print("03.02: failed")
+
+print("-----03.03-----")
+# Journal is compacted when it grows, keeping the latest values
+store = PoseStore(journal, compact_ratio=4, compact_min=8)
+for i in range(20):
+	store.save("drop", (i, 30, 30, 0, 0))
+store = PoseStore(journal)
+if (store.records <= 8 and store["drop"][0] == 19.0 and "pickup" in store):
+	print("03.03: passed")
+else:
+	print("03.03: failed")
+
+os.remove(journal)
+os.rmdir(directory)
+
+print("-----04.01-----")
+# Every inverse kinematics solution puts the grip point on the target
+failed = 0
+for x in (150, 250, 350):
+	for y in (-100, 0, 100):
+		for z in (20, 80, 200):
+			solutions = Kinematics.inverse(x, y, z)
+			if (len(solutions) == 0):
+				failed += 1
+			for solution in solutions:
+				(position, rotation) = Kinematics.forward(*solution)
+				if (max(abs(a - b) for a, b in zip(position, (x, y, z))) > 1e-6):
+					failed += 1
+if (failed == 0):
+	print("04.01: passed")
+else:
+	print("04.01: failed")
+
+print("-----04.02-----")
+# Forward then inverse gives back the joint angles
+angles = (30, 40, 70, 0)
+(position, rotation) = Kinematics.forward(*angles)
+solutions = Kinematics.inverse(*position)
+if (any(max(abs(a - b) for a, b in zip(solution, angles)) < 1e-6 for solution in solutions)):
+	print("04.02: passed")
+else:
+	print("04.02: failed")
+
+print("-----04.03-----")
+# Solver uses the cache for a repeated target and stays near the previous solution
+solver = Kinematics.Solver()
+first = solver.solve(*position, previous=angles)
+second = solver.solve(*position)
+if (solver.hits == 1 and solver.misses == 1 and first == second and
+	max(abs(a - b) for a, b in zip(first, angles)) < 1):
+	print("04.03: passed")
+else:
+	print("04.03: failed")
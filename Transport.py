@@ -0,0 +1,511 @@
+'''
+Transport.py
+Date:		17.10.26
+
+Transport layer for the AX18A class. A transport owns the half duplex
+servo bus and exposes the small part of the pyserial API used by the
+driver (write, read, flushInput, timeout) plus set_direction for the
+GPIO direction pin.
+
+Available transports:
+	serial:	real UART with RPi.GPIO direction pin (Raspberry Pi)
+	pty:	pseudo terminal served by a simulated bus thread
+	sim:	in-process simulated bus with AX-18A control tables and
+			1 Mbps wire timing
+'''
+
+import os
+import time
+import select
+import threading
+
+# Serial and GPIO are only needed for the real hardware transport
+try:
+	from serial import Serial
+except ImportError:
+	Serial = None
+
+try:
+	import RPi.GPIO as GPIO
+except (ImportError, RuntimeError):
+	GPIO = None
+
+class Transport:
+	# Base class for all transports. Direction constants match
+	# AX18A.GPIO_direction_TX and AX18A.GPIO_direction_RX
+	direction_TX = 1
+	direction_RX = 0
+
+	def __init__(self, timeout=0.1):
+		self.timeout = timeout
+
+	def write(self, data):
+		raise NotImplementedError
+
+	def read(self, size):
+		raise NotImplementedError
+
+	def readinto(self, buffer):
+		# Read up to len(buffer) bytes into buffer, returns number of bytes read
+		data = self.read(len(buffer))
+		buffer[:len(data)] = data
+		return len(data)
+
+	def flushInput(self):
+		pass
+
+	def fileno(self):
+		# File descriptor of the port, for use with select or an event loop
+		raise NotImplementedError
+
+	def set_direction(self, direction):
+		# Only the serial transport has a direction pin
+		pass
+
+	def close(self):
+		pass
+
+class SerialTransport(Transport):
+	# Transport for the real servo bus on the Raspberry Pi UART
+
+	def __init__(self, device="/dev/ttyAMA0", baudrate=1000000, timeout=0.1, direction_pin=18):
+		if (Serial is None or GPIO is None):
+			raise RuntimeError("SerialTransport: pyserial and RPi.GPIO are required")
+
+		Transport.__init__(self, timeout)
+		self.direction_pin = direction_pin
+
+		# Setup GPIO direction pin
+		GPIO.setwarnings(False)
+		GPIO.setmode(GPIO.BCM)
+		GPIO.setup(direction_pin, GPIO.OUT)
+
+		self.serial = Serial(device, baudrate=baudrate, timeout=timeout)
+
+	@property
+	def timeout(self):
+		return self._timeout
+
+	@timeout.setter
+	def timeout(self, value):
+		# Keep the serial port timeout in step with the transport timeout
+		self._timeout = value
+		serial = self.__dict__.get('serial')
+		if (serial is not None):
+			serial.timeout = value
+
+	def write(self, data):
+		return self.serial.write(data)
+
+	def read(self, size):
+		return self.serial.read(size)
+
+	def readinto(self, buffer):
+		return self.serial.readinto(buffer)
+
+	def flushInput(self):
+		self.serial.flushInput()
+
+	def fileno(self):
+		return self.serial.fileno()
+
+	def set_direction(self, direction):
+		GPIO.output(self.direction_pin, direction)
+
+	def close(self):
+		self.serial.close()
+
+# ---------------------------------------------
+# ------------- SIMULATED SERVOS --------------
+# ---------------------------------------------
+
+class SimulatedServo:
+	# Model of a single AX-18A servo: 50 byte control table, REG_WRITE
+	# buffer and a simple constant speed motion model
+
+	# Factory default control table (same as AX18A default register)
+	default_register = (
+		0x12, 0x00, 0x00, 0x01, 0x01, 0xFA, 0x00, 0x00, 0xFF, 0x03,
+		0x00, 0x46, 0x3C, 0x8C, 0xD7, 0x03, 0x02, 0x24, 0x24, 0x00,
+		0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x01, 0x01, 0x20, 0x20,
+		0x00, 0x00, 0x00, 0x00, 0xD7, 0x03, 0x00, 0x00, 0x00, 0x00,
+		0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x20, 0x00
+	)
+
+	# Addresses the servo will not accept writes to
+	read_only = frozenset((0x00, 0x01, 0x02, 0x0A, 0x14, 0x15, 0x16, 0x17) + tuple(range(0x24, 0x2F)))
+
+	# Error bits
+	error_range = 8
+	error_checksum = 16
+	error_instruction = 64
+
+	# Fastest speed, used when moving speed is 0 (position units per second)
+	max_speed = 114*6*3.41
+
+	def __init__(self, ID, position=512):
+		self.register = bytearray(SimulatedServo.default_register)
+		self.register[0x03] = ID
+		self.register[0x2A] = 120 	# 12.0 V
+		self.register[0x2B] = 35	# 35 degrees C
+		self.registered_write = None
+
+		# Motion state
+		self.position = float(position)
+		self.start_position = float(position)
+		self.start_time = 0.0
+		self.register[0x1E] = position & 0xFF
+		self.register[0x1F] = position >> 8
+		self.update(0.0)
+
+	@property
+	def id(self):
+		return self.register[0x03]
+
+	def goal(self):
+		return self.register[0x1E] | self.register[0x1F] << 8
+
+	def speed(self):
+		# Moving speed in position units per second
+		speed_value = (self.register[0x20] | self.register[0x21] << 8) & 0x3FF
+		if (speed_value == 0):
+			return SimulatedServo.max_speed
+		return speed_value*0.111*6*3.41
+
+	def update(self, now):
+		# Update present position, speed and moving registers for time now
+
+		goal = self.goal()
+		distance = goal - self.start_position
+		travelled = (now - self.start_time)*self.speed()
+		if (travelled >= abs(distance)):
+			self.position = float(goal)
+			moving = 0
+		else:
+			self.position = self.start_position + (travelled if distance > 0 else -travelled)
+			moving = 1
+
+		position_value = int(self.position)
+		self.register[0x24] = position_value & 0xFF
+		self.register[0x25] = position_value >> 8
+		speed_value = (self.register[0x20] | self.register[0x21] << 8) if moving else 0
+		self.register[0x26] = speed_value & 0xFF
+		self.register[0x27] = (speed_value >> 8) & 0x03
+		self.register[0x2E] = moving
+		self.register[0x2C] = 0 if self.registered_write is None else 1
+
+	def write(self, now, address, data):
+		# Write data to control table starting at address
+		# Returns error byte
+
+		if (address + len(data) > len(self.register)):
+			return SimulatedServo.error_range
+		for i in range(address, address+len(data)):
+			if (i in SimulatedServo.read_only):
+				return SimulatedServo.error_range
+
+		self.update(now)
+		self.register[address:address+len(data)] = data
+
+		# Restart motion from present position if goal or speed changed
+		if (address <= 0x21 and address+len(data) > 0x1E):
+			self.start_position = self.position
+			self.start_time = now
+			self.update(now)
+
+		# Writing goal position turns torque on
+		if (address <= 0x1F and address+len(data) > 0x1E):
+			self.register[0x18] = 1
+
+		return 0
+
+	def read(self, now, address, length):
+		# Read length bytes from address
+		# Returns (error, data)
+
+		if (address + length > len(self.register)):
+			return (SimulatedServo.error_range, b"")
+		self.update(now)
+		return (0, bytes(self.register[address:address+length]))
+
+	def reset(self):
+		position = int(self.position)
+		self.__init__(0x01, position)
+
+class SimulatedBus(Transport):
+	# In-process simulated servo bus. Instruction packets written to the bus
+	# are executed by the simulated servos and status packets are made
+	# available for reading after the return delay time and wire time.
+	#	ids: 		servo IDs present on the bus
+	#	baudrate:	bus speed used for wire timing
+	#	realtime:	if True, write and read take the same time as on the
+	#				real bus, otherwise time is only added to self.clock
+
+	def __init__(self, ids=(2, 3, 4, 5, 6, 7, 8), baudrate=1000000, timeout=0.1, realtime=True):
+		Transport.__init__(self, timeout)
+		self.servos = {ID: SimulatedServo(ID) for ID in ids}
+		self.byte_time = 10/baudrate 	# 8 data bits, start and stop bit
+		self.realtime = realtime
+
+		self.clock = 0.0 			# Simulated time spent on the bus (seconds)
+		self.start_time = time.perf_counter()
+		self.rx_buffer = bytearray()
+		self.rx_ready_time = 0.0 	# Clock time the rx buffer is complete
+		self.tx_buffer = bytearray()
+		self.collisions = 0 		# Number of replies garbled by a busy bus
+		self.lock = threading.Lock()
+
+	def now(self):
+		# Current bus time. Real time is used when running in real time so
+		# servos keep moving while the bus is idle
+		if (self.realtime):
+			return time.perf_counter() - self.start_time
+		return self.clock
+
+	def advance(self, seconds):
+		# Let seconds of bus time pass
+		if (seconds <= 0):
+			return
+		self.clock += seconds
+		if (self.realtime):
+			target_time = time.perf_counter() + seconds
+			if (seconds > 0.002):
+				time.sleep(seconds - 0.001)
+			while (time.perf_counter() < target_time):
+				pass
+
+	def write(self, data):
+		with self.lock:
+			tx_start = self.now()
+			tx_end = tx_start + len(data)*self.byte_time
+			self.advance(len(data)*self.byte_time)
+			for reply, delay, end in self.feed(data):
+				# Reply starts return delay after its instruction packet ended.
+				# If the bus is still busy, the reply collides and is garbled
+				start = tx_start + end*self.byte_time + delay
+				if (start < tx_end or start < self.rx_ready_time):
+					self.collisions += 1
+					reply = bytes(byte ^ 0x55 for byte in reply)
+				self.rx_ready_time = max(self.rx_ready_time, start + len(reply)*self.byte_time)
+				self.rx_buffer += reply
+		return len(data)
+
+	def read(self, size):
+		with self.lock:
+			if (len(self.rx_buffer) >= size):
+				self.advance(self.rx_ready_time - self.now())
+			else:
+				# Not enough data will ever arrive, wait for timeout
+				self.advance(self.timeout)
+			data = bytes(self.rx_buffer[:size])
+			del self.rx_buffer[:size]
+		return data
+
+	def readinto(self, buffer):
+		size = len(buffer)
+		with self.lock:
+			if (len(self.rx_buffer) >= size):
+				self.advance(self.rx_ready_time - self.now())
+			else:
+				self.advance(self.timeout)
+			received = min(size, len(self.rx_buffer))
+			buffer[:received] = self.rx_buffer[:received]
+			del self.rx_buffer[:received]
+		return received
+
+	def flushInput(self):
+		with self.lock:
+			self.rx_buffer.clear()
+
+	def feed(self, data):
+		# Add raw bytes to the instruction stream and execute complete packets
+		# Returns list of (status packet, return delay, end) tuples, where end
+		# is the number of bytes of data sent when the instruction packet ended
+
+		replies = []
+		buf = self.tx_buffer
+		position = -len(buf)	# Position in data of the start of buf
+		buf += data
+		while (len(buf) >= 6):
+			# Find start signal
+			if (buf[0] != 0xFF or buf[1] != 0xFF):
+				del buf[0]
+				position += 1
+				continue
+			packet_length = buf[3]+4
+			if (len(buf) < packet_length):
+				break
+			packet = bytes(buf[:packet_length])
+			del buf[:packet_length]
+			position += packet_length
+			reply = self.execute(packet)
+			if (reply is not None):
+				replies.append(reply + (position,))
+		return replies
+
+	def execute(self, packet):
+		# Execute a single instruction packet
+		# Returns (status packet, return delay) or None if no reply is sent
+
+		ID = packet[2]
+		instruction = packet[4]
+		parameters = packet[5:-1]
+		checksum = (~sum(packet[2:-1])) & 0xFF
+		now = self.now()
+
+		if (ID == 0xFE):
+			servos = list(self.servos.values())
+		elif (ID in self.servos):
+			servos = [self.servos[ID]]
+		else:
+			return None
+		old_ids = [servo.id for servo in servos]
+
+		error = 0
+		data = b""
+		if (checksum != packet[-1]):
+			error = SimulatedServo.error_checksum
+		elif (instruction == 0x01):		# Ping
+			pass
+		elif (instruction == 0x02):		# Read data
+			if (len(parameters) != 2):
+				error = SimulatedServo.error_instruction
+			else:
+				error, data = servos[0].read(now, parameters[0], parameters[1])
+		elif (instruction == 0x03):		# Write data
+			for servo in servos:
+				error = servo.write(now, parameters[0], parameters[1:])
+		elif (instruction == 0x04):		# Reg write
+			for servo in servos:
+				servo.registered_write = (parameters[0], bytes(parameters[1:]))
+		elif (instruction == 0x05):		# Action
+			for servo in servos:
+				if (servo.registered_write is not None):
+					address, values = servo.registered_write
+					servo.registered_write = None
+					servo.write(now, address, values)
+		elif (instruction == 0x06):		# Reset
+			for servo in servos:
+				servo.reset()
+		elif (instruction == 0x83):		# Sync write
+			address = parameters[0]
+			nParams = parameters[1]
+			for i in range(2, len(parameters), nParams+1):
+				servo = self.servos.get(parameters[i])
+				if (servo is not None):
+					servo.write(now, address, parameters[i+1:i+1+nParams])
+		else:
+			error = SimulatedServo.error_instruction
+
+		# Servo IDs may have changed by a reset or a write to the ID register
+		for old_id, servo in zip(old_ids, servos):
+			if (servo.id != old_id):
+				if (self.servos.get(old_id) is servo):
+					del self.servos[old_id]
+				self.servos[servo.id] = servo
+
+		# No status packets for broadcasting ID or sync write
+		if (ID == 0xFE or instruction == 0x83):
+			return None
+		servo = servos[0]
+
+		# Status return level 0: only ping, 1: only read data, 2: all
+		status_return_level = servo.register[0x10]
+		if (instruction != 0x01 and
+			(status_return_level == 0 or (status_return_level == 1 and instruction != 0x02))):
+			return None
+
+		# The reset reply is sent before the factory ID takes effect
+		reply_id = old_ids[0] if instruction == 0x06 else servo.id
+		reply = bytearray((0xFF, 0xFF, reply_id, len(data)+2, error))
+		reply += data
+		reply.append((~sum(reply[2:])) & 0xFF)
+		return_delay = servo.register[0x05]*2e-6
+		return (bytes(reply), return_delay)
+
+class PtyTransport(Transport):
+	# Transport using a pseudo terminal. The driver reads and writes the
+	# slave side like a real serial port, while a thread serves the master
+	# side with a simulated bus.
+	#	bus: 	SimulatedBus to serve, a new one is created if None
+
+	def __init__(self, bus=None, timeout=0.1):
+		import tty
+		Transport.__init__(self, timeout)
+
+		if (bus is None):
+			bus = SimulatedBus(realtime=False)
+		self.bus = bus
+
+		self.master, self.slave = os.openpty()
+		tty.setraw(self.master)
+		tty.setraw(self.slave)
+		self.device = os.ttyname(self.slave)
+
+		self.running = True
+		self.thread = threading.Thread(target=self.serve, daemon=True)
+		self.thread.start()
+
+	def serve(self):
+		# Thread serving the master side of the pseudo terminal
+		while (self.running):
+			try:
+				ready, _, _ = select.select((self.master,), (), (), 0.05)
+				if (not ready):
+					continue
+				data = os.read(self.master, 1024)
+			except OSError:
+				break
+			for reply, delay, end in self.bus.feed(data):
+				time.sleep(delay)
+				os.write(self.master, reply)
+
+	def write(self, data):
+		return os.write(self.slave, data)
+
+	def fileno(self):
+		return self.slave
+
+	def read(self, size):
+		buffer = bytearray(size)
+		received = self.readinto(buffer)
+		return bytes(buffer[:received])
+
+	def readinto(self, buffer):
+		# Read directly into buffer, waiting at most timeout for all bytes
+		buffer = memoryview(buffer)
+		size = len(buffer)
+		received = 0
+		deadline = time.perf_counter() + self.timeout
+		while (received < size):
+			remaining = deadline - time.perf_counter()
+			if (remaining <= 0):
+				break
+			ready, _, _ = select.select((self.slave,), (), (), remaining)
+			if (not ready):
+				break
+			received += os.readv(self.slave, (buffer[received:],))
+		return received
+
+	def flushInput(self):
+		import termios
+		termios.tcflush(self.slave, termios.TCIFLUSH)
+
+	def close(self):
+		self.running = False
+		self.thread.join()
+		os.close(self.master)
+		os.close(self.slave)
+
+# Transports selectable by name
+transports = {
+	'serial': SerialTransport,
+	'pty': PtyTransport,
+	'sim': SimulatedBus
+}
+
+def get_transport(name, **kwargs):
+	# Create transport from name, see transports dictionary
+	#	name: 		serial, pty or sim
+	#	**kwargs:	passed on to the transport constructor
+	return transports[name](**kwargs)